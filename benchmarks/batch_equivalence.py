@@ -0,0 +1,106 @@
+""" Statistical equivalence check of BatchSimulator against Simulator.run
+
+Usage (from the repository root):
+    python benchmarks/batch_equivalence.py [--runs 300] [--nodes 200]
+
+For each uniform protocol, compares the per-run mean stretch and the number of
+reached nodes of both engines with a two-sample Kolmogorov-Smirnov test, and
+reports the time taken by each. Exits with status 1 if any p-value is below
+--alpha (0.01 by default), which points to a divergence.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.stats import ks_2samp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+
+from core.batch_simulator import BatchSimulator  # noqa: E402
+from core.gossip_algorithm import CobraWalk, GossipSub, RandomWalk  # noqa: E402
+from core.network import Network  # noqa: E402
+from core.simulator import Simulator  # noqa: E402
+
+
+def summarize(stretches) -> np.ndarray:
+    """Per-run (mean stretch, reached nodes)"""
+    return np.array(
+        [
+            (np.mean(stretch.values) if stretch.values else np.nan, len(stretch.values))
+            for stretch in stretches
+        ]
+    )
+
+
+def compare(
+    network: Network, algorithm, runs: int, limit: int
+) -> tuple[np.ndarray, np.ndarray, dict[str, float], float, float]:
+    """Runs both engines [runs] times. Returns their per-run summaries, the KS
+    p-value of each metric and the time taken by each engine."""
+    simulator = Simulator(network, algorithm)
+    simulator.seed(0)
+    start = time.perf_counter()
+    reference = []
+    for _ in range(runs):
+        simulator.setup()
+        stretch, _ = simulator.run(msg_receival_limit=limit)
+        reference.append(stretch)
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = BatchSimulator(network, algorithm).run(
+        n_runs=runs, seed=0, msg_receival_limit=limit
+    )
+    batch_time = time.perf_counter() - start
+
+    reference, batch = summarize(reference), summarize(batch)
+    finite = lambda values: values[np.isfinite(values)]  # noqa: E731
+    p_values = {
+        "stretch": ks_2samp(finite(reference[:, 0]), finite(batch[:, 0])).pvalue,
+        "reached": ks_2samp(reference[:, 1], batch[:, 1]).pvalue,
+    }
+    return reference, batch, p_values, reference_time, batch_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=300)
+    parser.add_argument("--nodes", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=3)
+    parser.add_argument("--alpha", type=float, default=0.01)
+    args = parser.parse_args()
+
+    network = Network.randomize(args.nodes, grid_size=1000, seed=0)
+    algorithms = [GossipSub(network, 6), CobraWalk(network, 0.6), RandomWalk(network)]
+
+    failures = []
+    for algorithm in algorithms:
+        name = type(algorithm).__name__
+        reference, batch, p_values, reference_time, batch_time = compare(
+            network, algorithm, args.runs, args.limit
+        )
+        print(
+            f"{name:>10}: "
+            f"stretch {np.nanmean(reference[:, 0]):.3f} vs {np.nanmean(batch[:, 0]):.3f} "
+            f"(p={p_values['stretch']:.3f}), "
+            f"reached {reference[:, 1].mean():.1f} vs {batch[:, 1].mean():.1f} "
+            f"(p={p_values['reached']:.3f}), "
+            f"time {reference_time:.2f}s vs {batch_time:.2f}s"
+        )
+        failures += [
+            f"{name} {metric} (p={p_value:.4f})"
+            for metric, p_value in p_values.items()
+            if not p_value >= args.alpha
+        ]
+
+    if failures:
+        print(f"Diverging below alpha={args.alpha}: " + ", ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
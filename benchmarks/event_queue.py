@@ -0,0 +1,70 @@
+""" Benchmark of the simulator's event queue variants
+
+Usage (from the repository root):
+    python benchmarks/event_queue.py [--runs 20] [--fanout 8] [--limit 10]
+
+Uses the ping dataset under experiments/data/datasets when available, otherwise a
+synthetic Network.randomize topology of --nodes nodes.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+
+from core.event_queue import ArrayEventQueue, HeapEventQueue  # noqa: E402
+from core.gossip_algorithm import GossipSub  # noqa: E402
+from core.network import Network  # noqa: E402
+from core.simulator import Simulator  # noqa: E402
+
+DATASETS = os.path.join(ROOT, "experiments", "data", "datasets")
+
+
+def load_network(num_nodes: int) -> Network:
+    """Loads the real dataset, or a synthetic network if it is not present"""
+    pings = os.path.join(DATASETS, "pings.csv")
+    servers = os.path.join(DATASETS, "servers.csv")
+    if os.path.exists(pings) and os.path.exists(servers):
+        return Network.from_csv(pings, servers)
+    print(f"Dataset not found, using a synthetic network of {num_nodes} nodes")
+    return Network.randomize(num_nodes, grid_size=1000, seed=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--nodes", type=int, default=1000)
+    args = parser.parse_args()
+
+    network = load_network(args.nodes)
+    simulator = Simulator(network, GossipSub(network, fanout=args.fanout))
+
+    for event_queue in (HeapEventQueue, ArrayEventQueue):
+        random.seed(0)
+        np.random.seed(0)
+        network.seed(0)
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            simulator.setup()
+            simulator.run(
+                stop_when_all_informed=False,
+                msg_receival_limit=args.limit,
+                event_queue=event_queue,
+            )
+        elapsed = time.perf_counter() - start
+        print(
+            f"{event_queue.__name__:>16}: {args.runs / elapsed:8.2f} runs/s "
+            f"({elapsed / args.runs * 1000:.1f} ms/run)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+""" Memory and allocation benchmark of the basic simulator types
+
+Usage (from the repository root):
+    python benchmarks/memory.py [--nodes 10000] [--events 100000]
+
+Compares the per-object footprint of the slotted Node/Ping/Event/Euclidean2D
+types (and of a network's node storage) with the previous dict-backed
+definitions, which are reproduced inline below.
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+
+from core.network import Network  # noqa: E402
+from utils.basic_types import Event, Node, Ping  # noqa: E402
+from utils.position import Euclidean2D  # noqa: E402
+
+
+class LegacyNodeID(int):
+    """NodeID"""
+
+
+class LegacyEuclidean2D:
+    """Euclidean2D without __slots__"""
+
+    def __init__(self, x: float, y: float):
+        self.x = x
+        self.y = y
+
+
+@dataclass
+class LegacyNode:
+    """Node"""
+
+    node_id: LegacyNodeID
+    pos: LegacyEuclidean2D
+
+
+@dataclass
+class LegacyPing:
+    """Ping"""
+
+    base: float
+    std_dev: float
+
+
+@dataclass
+class LegacyEvent:
+    """Network event"""
+
+    source: LegacyNodeID
+    target: LegacyNodeID
+    timestamp: float
+    id: int
+
+
+def measure(build) -> tuple[int, float]:
+    """Returns the bytes still allocated by build() and the time it took"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    objects = build()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size, elapsed
+
+
+def report(name: str, count: int, legacy, current):
+    """Prints the legacy and current footprint of count objects"""
+    legacy_size, legacy_time = measure(legacy)
+    size, elapsed = measure(current)
+    print(
+        f"{name:<8} legacy {legacy_size / count:7.1f} B/obj {legacy_time:7.3f}s  "
+        f"slotted {size / count:7.1f} B/obj {elapsed:7.3f}s  "
+        f"({legacy_size / max(size, 1):.2f}x)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=10_000)
+    parser.add_argument("--events", type=int, default=100_000)
+    args = parser.parse_args()
+    n, m = args.nodes, args.events
+
+    report(
+        "Node",
+        n,
+        lambda: [
+            LegacyNode(LegacyNodeID(i), LegacyEuclidean2D(float(i), float(i)))
+            for i in range(n)
+        ],
+        lambda: [Node(i, Euclidean2D(float(i), float(i))) for i in range(n)],
+    )
+    report(
+        "Ping",
+        n,
+        lambda: [LegacyPing(float(i), 0.1) for i in range(n)],
+        lambda: [Ping(float(i), 0.1) for i in range(n)],
+    )
+    report(
+        "Event",
+        m,
+        lambda: [
+            LegacyEvent(LegacyNodeID(i % n), LegacyNodeID((i + 1) % n), float(i), i)
+            for i in range(m)
+        ],
+        lambda: [Event(i % n, (i + 1) % n, float(i), i) for i in range(m)],
+    )
+    report(
+        "Heap",
+        m,
+        lambda: [
+            (float(i), i, LegacyNodeID(i % n), LegacyNodeID((i + 1) % n))
+            for i in range(m)
+        ],
+        lambda: [(float(i), i, i % n, (i + 1) % n) for i in range(m)],
+    )
+
+    size, elapsed = measure(lambda: Network.randomize(n, grid_size=1000, seed=0))
+    print(
+        f"Network.randomize({n}) {size / 2**20:.1f} MiB {elapsed:.3f}s "
+        f"(node storage is an id array plus an N x 2 position array)"
+    )
+
+
+if __name__ == "__main__":
+    main()
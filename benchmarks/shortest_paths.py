@@ -0,0 +1,70 @@
+""" Benchmark of Simulator.run_shortest_paths against the event loop
+
+Usage (from the repository root):
+    python benchmarks/shortest_paths.py [--runs 200] [--nodes 500]
+
+Compares stretch and run time of Simulator.run(msg_receival_limit=0), for which
+the shortest-path mode is exact in distribution, with run_shortest_paths using a
+new graph per source and one graph shared by all sources.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.stats import ks_2samp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+
+from core.gossip_algorithm import CobraWalk, GossipSub  # noqa: E402
+from core.network import Network  # noqa: E402
+from core.simulator import Simulator  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--nodes", type=int, default=500)
+    args = parser.parse_args()
+
+    network = Network.randomize(args.nodes, grid_size=1000, seed=0)
+    for algorithm in (GossipSub(network, 6), CobraWalk(network, 0.8)):
+        simulator = Simulator(network, algorithm)
+        simulator.seed(0)
+
+        start = time.perf_counter()
+        event_loop = []
+        for _ in range(args.runs):
+            simulator.setup()
+            stretch, _ = simulator.run(msg_receival_limit=0)
+            event_loop.append(stretch.mean() if stretch.values else np.nan)
+        results = {"event loop": (time.perf_counter() - start, event_loop)}
+
+        for resample in (True, False):
+            start = time.perf_counter()
+            stretches = simulator.run_shortest_paths(
+                n_runs=args.runs, seed=0, resample_per_source=resample
+            )
+            results["dijkstra (per source)" if resample else "dijkstra (shared)"] = (
+                time.perf_counter() - start,
+                [stretch.mean() if stretch.values else np.nan for stretch in stretches],
+            )
+
+        print(type(algorithm).__name__)
+        reference = np.array(event_loop)
+        reference = reference[np.isfinite(reference)]
+        for name, (elapsed, means) in results.items():
+            means = np.array(means)
+            means = means[np.isfinite(means)]
+            p_value = ks_2samp(reference, means).pvalue
+            print(
+                f"  {name:>22}: stretch {means.mean():.3f} (KS p={p_value:.3f}), "
+                f"{elapsed / args.runs * 1000:.2f} ms/run"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+""" Benchmark suite of the simulator's hot paths
+
+Usage (from the repository root):
+    python benchmarks/suite.py [--sizes 100 1000 5000] [--filter run_]
+                               [--output benchmarks/results] [--compare OLD.json]
+
+Every benchmark runs on synthetic fixtures (nodes at uniform random latitudes and
+longitudes), so the suite works offline. For each benchmark and network size it reports the best and median time
+per call, calls per second and the peak traced memory of one call, plus the
+overhead of 100 attackers on a GossipSub run. Results are written as JSON (named
+after the commit) so that runs can be compared across commits with --compare.
+"""
+
+import argparse
+import atexit
+from collections.abc import Callable
+from dataclasses import dataclass
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from scipy.spatial.distance import cdist
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+
+from core import clustering, gossip_algorithm  # noqa: E402
+from core.attacker import (  # noqa: E402
+    LowestTimeEstimator,
+    UniformEstimator,
+    create_random_attackers,
+)
+from core.gossip_algorithm import (  # noqa: E402
+    CobraWalk,
+    GossipSub,
+    HierarchialGossip,
+    HierarchicalIntraCobraWalkInterBernoulliWithVoronoi,
+    RandomWalk,
+    SpatialGossip,
+    SpatialGossipWithCobraWalk,
+)
+from core.network import Network  # noqa: E402
+from core.simulator import Simulator  # noqa: E402
+
+SIZES = (100, 1000, 5000)
+GRID_SIZE = 1000  # Of the network_randomize benchmark
+NUM_ATTACKERS = 100
+
+PROTOCOLS: dict[str, Callable[[Network], object]] = {
+    "RandomWalk": RandomWalk,
+    "CobraWalk": lambda network: CobraWalk(network, 0.5),
+    "GossipSub": lambda network: GossipSub(network, 4),
+    "SpatialGossip": lambda network: SpatialGossip(network, 2, 0.5),
+    "SpatialGossipWithCobraWalk": lambda network: SpatialGossipWithCobraWalk(
+        network, 2, 0.5, 0.5
+    ),
+    "HierarchialGossip": lambda network: HierarchialGossip(network, 2, 2, 8),
+    "HierarchicalVoronoi": lambda network: (
+        HierarchicalIntraCobraWalkInterBernoulliWithVoronoi(network, 0.5, 0.5, 2, 8)
+    ),
+}
+
+
+@dataclass
+class Benchmark:
+    """A benchmark: setup(network) returns the function to time"""
+
+    name: str
+    setup: Callable[[Network], Callable[[], object]]
+    max_nodes: int | None = None
+
+
+BENCHMARKS: list[Benchmark] = []
+
+
+def benchmark(name: str, max_nodes: int | None = None):
+    """Registers a benchmark setup function"""
+
+    def register(setup):
+        BENCHMARKS.append(Benchmark(name, setup, max_nodes))
+        return setup
+
+    return register
+
+
+def fixture(num_nodes: int) -> Network:
+    """Network of nodes at uniform random (latitude, longitude) positions, with the
+    distance as base delay. Positions are floats, so distinct nodes never share a
+    position (which would give zero delays and infinite stretches)."""
+    rng = np.random.default_rng(0)
+    positions = np.column_stack(
+        [rng.uniform(-90, 90, num_nodes), rng.uniform(-180, 180, num_nodes)]
+    )
+    base = cdist(positions, positions)
+    np.fill_diagonal(base, np.inf)
+    std_dev = np.full_like(base, 0.1)
+    np.fill_diagonal(std_dev, 0)
+    return Network.from_matrix(np.arange(num_nodes), positions, base, std_dev)
+
+
+def clear_caches() -> None:
+    """Empties the per-network caches, so constructors are timed cold"""
+    gossip_algorithm.clear_spatial_caches()
+    clustering._clustering_cache.clear()
+
+
+def seeded_runs(
+    simulator: Simulator,
+    attackers: Callable[[Simulator], list] | None = None,
+) -> Callable[[], object]:
+    """One simulation per call, each with the next seed"""
+    seeds = iter(range(1 << 30))
+
+    def run():
+        simulator.seed(next(seeds))
+        simulator.setup()
+        return simulator.run(attackers=attackers(simulator) if attackers else [])
+
+    return run
+
+
+@benchmark("network_randomize")
+def network_randomize(network: Network):
+    num_nodes = len(network.nodes)
+    return lambda: Network.randomize(num_nodes, GRID_SIZE, seed=0)
+
+
+@benchmark("network_from_matrix")
+def network_from_matrix(network: Network):
+    node_ids = np.array(list(network.node_index))
+    return lambda: Network.from_matrix(
+        node_ids, network.positions, network.base, network.std_dev
+    )
+
+
+@benchmark("network_from_csv", max_nodes=1000)
+def network_from_csv(network: Network):
+    # The CSVs of a 5k-node network would hold 25M pings, so only the smaller
+    # sizes are parsed; network_from_matrix covers the load at every size
+    directory = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    node_ids = np.array(list(network.node_index))
+    pings_filename = os.path.join(directory, "pings.csv")
+    servers_filename = os.path.join(directory, "servers.csv")
+    sources, targets = np.nonzero(np.isfinite(network.base))
+    pd.DataFrame(
+        {
+            "source": node_ids[sources],
+            "destination": node_ids[targets],
+            "timestamp": "",
+            "min": 0.0,
+            "avg": network.base[sources, targets],
+            "max": 0.0,
+            "mdev": network.std_dev[sources, targets],
+        }
+    ).to_csv(pings_filename, index=False)
+    pd.DataFrame(
+        {
+            "id": node_ids,
+            "latitude": network.positions[:, 0],
+            "longitude": network.positions[:, 1],
+        }
+    ).to_csv(servers_filename, index=False)
+
+    def load():
+        # A fresh cache directory every call, so the CSVs are parsed each time
+        return Network.from_csv(
+            pings_filename, servers_filename, cache_dir=tempfile.mkdtemp(dir=directory)
+        )
+
+    return load
+
+
+@benchmark("spatial_gossip_init")
+def spatial_gossip_init(network: Network):
+    def init():
+        clear_caches()
+        return SpatialGossip(network, 2, 0.5)
+
+    return init
+
+
+@benchmark("cluster_network")
+def cluster_network(network: Network):
+    def init():
+        clear_caches()
+        return clustering.cluster_network(network, 8)
+
+    return init
+
+
+def register_protocol_runs():
+    for protocol, create in PROTOCOLS.items():
+
+        def setup(network: Network, create=create):
+            return seeded_runs(Simulator(network, create(network)))
+
+        benchmark(f"run_{protocol}")(setup)
+
+
+def register_attacker_runs():
+    for cls in (UniformEstimator, LowestTimeEstimator):
+
+        def setup(network: Network, cls=cls):
+            node_ids = list(network.node_index)
+
+            def attackers(simulator: Simulator):
+                return create_random_attackers(
+                    cls,
+                    node_ids,
+                    simulator.first_source.node_id,
+                    0.1,
+                    num_attackers=NUM_ATTACKERS,
+                )
+
+            return seeded_runs(Simulator(network, GossipSub(network, 4)), attackers)
+
+        benchmark(f"attackers_{cls.__name__}")(setup)
+
+
+register_protocol_runs()
+register_attacker_runs()
+
+
+def measure(function: Callable[[], object], min_time: float, max_calls: int) -> dict:
+    """Times [function] (after a warm-up call) until [min_time] seconds or
+    [max_calls] calls, then traces the peak memory of one more call"""
+    function()
+    times: list[float] = []
+    while len(times) < max_calls and sum(times) < min_time:
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(times)
+    return {
+        "calls": len(times),
+        "best": min(times),
+        "median": median,
+        "per_second": 1 / median,
+        "peak_memory": peak,
+    }
+
+
+def git_commit() -> str:
+    """Current commit hash (with a -dirty suffix for uncommitted changes)"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if status.strip() else "")
+
+
+def compare(results: list[dict], baseline_filename: str) -> None:
+    """Prints the median time of every benchmark relative to a previous run"""
+    with open(baseline_filename, "r") as file:
+        baseline = {
+            (row["name"], row["nodes"]): row for row in json.load(file)["results"]
+        }
+    print(f"\nCompared to {baseline_filename} (old / new median, >1 is faster)")
+    for row in results:
+        old = baseline.get((row["name"], row["nodes"]))
+        if old is not None:
+            print(
+                f"{row['name']:<36} {row['nodes']:>6} "
+                f"{old['median'] / row['median']:6.2f}x"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument(
+        "--filter", default="", help="Only run benchmarks whose name contains this"
+    )
+    parser.add_argument("--min-time", type=float, default=1.0)
+    parser.add_argument("--max-calls", type=int, default=20)
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results"))
+    parser.add_argument("--compare", help="Previous results file to compare with")
+    args = parser.parse_args()
+
+    results: list[dict] = []
+    for num_nodes in args.sizes:
+        random.seed(0)
+        np.random.seed(0)
+        network = fixture(num_nodes)
+        for bench in BENCHMARKS:
+            if args.filter not in bench.name:
+                continue
+            if bench.max_nodes is not None and num_nodes > bench.max_nodes:
+                continue
+            clear_caches()
+            row = {"name": bench.name, "nodes": num_nodes}
+            row.update(measure(bench.setup(network), args.min_time, args.max_calls))
+            results.append(row)
+            print(
+                f"{bench.name:<36} {num_nodes:>6} {row['median'] * 1000:10.2f} ms "
+                f"{row['per_second']:10.2f}/s {row['peak_memory'] / 2**20:8.1f} MiB"
+            )
+
+    # Attacker overhead: GossipSub runs with and without the attackers
+    by_name = {(row["name"], row["nodes"]): row for row in results}
+    overheads = []
+    for (name, num_nodes), row in by_name.items():
+        baseline = by_name.get(("run_GossipSub", num_nodes))
+        if name.startswith("attackers_") and baseline is not None:
+            overheads.append(
+                {
+                    "name": name[len("attackers_") :],
+                    "nodes": num_nodes,
+                    "overhead_per_100_attackers": (row["median"] - baseline["median"])
+                    * 100
+                    / NUM_ATTACKERS,
+                }
+            )
+            print(
+                f"{name:<36} {num_nodes:>6} "
+                f"+{overheads[-1]['overhead_per_100_attackers'] * 1000:.2f} ms "
+                "per 100 attackers"
+            )
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "results": results,
+        "attacker_overhead": overheads,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    filename = os.path.join(
+        args.output,
+        f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{commit[:12]}.json",
+    )
+    with open(filename, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {filename}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,39 @@
 """ This file adds the Attacker class (and some examples) for the anonymity simulation """
 
 from abc import ABC, abstractmethod
+from collections.abc import Mapping
 import random
+from types import MappingProxyType
 
+import numpy as np
+from scipy.sparse import csr_matrix
 from utils.basic_types import Event, NodeID
 
 
 class Attacker(ABC):
-    """This abstract class represents a general anonymity attacker"""
+    """This abstract class represents a general anonymity attacker.
+
+    The estimate is kept in [weights]: unnormalized probabilities aligned with
+    node_ids, 0 for curious nodes. probabilities(), probability and guess() are
+    derived from it, so estimators must maintain [weights] (or override all of
+    them, as LowestTimeEstimator does).
+    """
 
     name: str = "Abstract"
 
     def __init__(self, node_ids: list[NodeID], curious_node_ids: list[NodeID]):
         self.node_ids = node_ids
-        self.curious_node_ids: set[NodeID] = curious_node_ids
-        self.num_honest_peers = len(node_ids) - len(curious_node_ids)
+        self.curious_node_ids: set[NodeID] = set(curious_node_ids)
+        self.num_honest_peers = len(node_ids) - len(self.curious_node_ids)
+        self.node_index: dict[NodeID, int] = {
+            node_id: index for index, node_id in enumerate(node_ids)
+        }
+        self.honest = np.array(
+            [node_id not in self.curious_node_ids for node_id in node_ids], dtype=bool
+        )
 
-        # Initialize probabilities as 0
-        self.probability: dict[NodeID, float] = {}
-        for peer_id in self.node_ids:
-            if peer_id not in self.curious_node_ids:
-                self.probability[peer_id] = 0
+        # Unnormalized probabilities, aligned with node_ids (0 for curious nodes)
+        self.weights = np.zeros(len(node_ids))
 
     @abstractmethod
     def process_event(self, event: Event) -> None:
@@ -33,15 +46,46 @@ class Attacker(ABC):
             or event.source in self.curious_node_ids
         )
 
+    def probabilities(self) -> np.ndarray:
+        """Returns the normalized probabilities, aligned with node_ids"""
+        total = self.weights.sum()
+        return self.weights / total if total > 0 else self.weights.copy()
+
+    @property
+    def probability(self) -> Mapping[NodeID, float]:
+        """Probability of each honest peer being the creator of the message, as a
+        read-only snapshot: item writes raise, assign the whole mapping instead"""
+        probabilities = self.probabilities()
+        return MappingProxyType(
+            {
+                node_id: float(probabilities[index])
+                for index, node_id in enumerate(self.node_ids)
+                if self.honest[index]
+            }
+        )
+
+    @probability.setter
+    def probability(self, probability: Mapping[NodeID, float]) -> None:
+        """Replaces the probabilities, written through to [weights] (peers missing
+        from the mapping get 0)"""
+        weights = np.zeros(len(self.node_ids))
+        for node_id, value in probability.items():
+            index = self.node_index[node_id]
+            if not self.honest[index]:
+                raise ValueError(f"Node {node_id} is curious and cannot be a creator")
+            weights[index] = value
+        self.set_weights(weights)
+
+    def set_weights(self, weights: np.ndarray) -> None:
+        """Replaces the unnormalized probabilities"""
+        self.weights = weights
+
     def guess(self) -> NodeID:
         """This function returns the attacker's NodeID guess for the creator of the message"""
-        highest_probability = 0
-        highest_probability_peer = -1
-        for i, p in self.probability.items():
-            if p > highest_probability:
-                highest_probability = p
-                highest_probability_peer = i
-        return highest_probability_peer
+        index = int(np.argmax(self.weights))
+        if self.weights[index] <= 0:
+            return -1
+        return self.node_ids[index]
 
     @abstractmethod
     def process_all_events(
@@ -49,6 +93,52 @@ class Attacker(ABC):
     ) -> None:
         """Receives events per curious node and process all events to update its probability map"""
 
+    @classmethod
+    def bulk_guess(
+        cls,
+        membership: np.ndarray,
+        node_ids: list[NodeID],
+        sources: np.ndarray,
+        targets: np.ndarray,
+        timestamps: np.ndarray,
+    ) -> list[NodeID]:
+        """Returns the guess of one attacker per row of [membership] (an A x N boolean
+        matrix of curious nodes, aligned with [node_ids]) after observing the event
+        log (node indices and timestamps, in processing order).
+        By default, each attacker is created and fed its accessible events."""
+        guesses: list[NodeID] = []
+        for curious in membership:
+            attacker = cls(node_ids, [node_ids[i] for i in np.flatnonzero(curious)])
+            accessible = np.flatnonzero(curious[sources] | curious[targets])
+            for i in accessible.tolist():
+                attacker.process_event(
+                    Event(
+                        source=node_ids[sources[i]],
+                        target=node_ids[targets[i]],
+                        timestamp=float(timestamps[i]),
+                        id=i,
+                    )
+                )
+            guesses.append(attacker.guess())
+        return guesses
+
+
+def observed_events(
+    membership: np.ndarray, sources: np.ndarray, targets: np.ndarray
+) -> np.ndarray:
+    """A x E matrix of the events each attacker processes: events to one of its
+    curious nodes that were not sent by one of them"""
+    return membership[:, targets] & ~membership[:, sources]
+
+
+def first_honest_node(membership: np.ndarray) -> np.ndarray:
+    """Index of the first non-curious node of each attacker"""
+    return np.argmax(~membership, axis=1)
+
+
+# Number of events processed together by the vectorized estimators
+EVENT_CHUNK = 1 << 15
+
 
 class UniformEstimator(Attacker):
     """The UniformEstimator is an attacker that inits with equal probability for all known NodeIDs.
@@ -59,23 +149,33 @@ class UniformEstimator(Attacker):
     Then it normalizes the probabilities.
     Notice that later the message, greater f, and smaller 1/f.
     Earlier the message, smaller the f, and greater 1/f.
+
+    Probabilities are kept unnormalized, as weights w with their running total W
+    (p = w / W). Adding c to p and normalizing is the same as adding c * W to w
+    and multiplying W by (1 + c), so each event is O(1).
     """
 
     name: str = "Uniform estimator"
 
+    # Weights are rescaled when their total exceeds this value
+    MAX_TOTAL: float = 1e200
+
     def __init__(self, node_ids: list[NodeID], curious_node_ids: list[NodeID]):
         super().__init__(node_ids, curious_node_ids)
 
         uniform_probability = 1 / self.num_honest_peers
-        for peer_id in self.node_ids:
-            if peer_id not in self.curious_node_ids:
-                self.probability[peer_id] = uniform_probability
+        self.weights[self.honest] = uniform_probability
+        self.total = 1.0
 
     def normalize(self) -> None:
-        """This function normalizes all probabilities"""
-        total_sum = sum(self.probability.values())
-        for i, p in self.probability.items():
-            self.probability[i] = p / total_sum
+        """This function normalizes all weights (so they sum to 1)"""
+        self.weights /= self.total
+        self.total = 1.0
+
+    def set_weights(self, weights: np.ndarray) -> None:
+        super().set_weights(weights)
+        total = float(weights.sum())
+        self.total = total if total > 0 else 1.0
 
     def process_event(self, event: Event) -> None:
         # If sender is a curious node, just return
@@ -84,11 +184,72 @@ class UniformEstimator(Attacker):
 
         delivery_time = max(0.1, event.timestamp)
         delivery_time_factor = delivery_time / 0.1
-        self.probability[event.source] = self.probability[event.source] + 1 / (
-            self.num_honest_peers
-        ) * (1 / delivery_time_factor)
-
-        self.normalize()
+        increment = 1 / (self.num_honest_peers) * (1 / delivery_time_factor)
+        self.weights[self.node_index[event.source]] += increment * self.total
+        self.total *= 1 + increment
+        if self.total > self.MAX_TOTAL:
+            self.normalize()
+
+    def probabilities(self) -> np.ndarray:
+        return self.weights / self.total
+
+    @classmethod
+    def bulk_guess(
+        cls,
+        membership: np.ndarray,
+        node_ids: list[NodeID],
+        sources: np.ndarray,
+        targets: np.ndarray,
+        timestamps: np.ndarray,
+    ) -> list[NodeID]:
+        # With L_e = sum of log(1 + c) over the attacker's events before e, the
+        # final probability of s is (w0 + sum of c_e * exp(L_e) over events from s)
+        # divided by exp(L_final)
+        num_attackers, num_nodes = membership.shape
+        num_honest = num_nodes - membership.sum(axis=1)
+        factors = 1 / np.maximum(0.1, timestamps) * 0.1
+
+        def chunk_increments(chunk: slice) -> np.ndarray:
+            # A x chunk matrix of the increments c (1 / N * 1 / f) of each event,
+            # built per chunk so memory stays bounded by EVENT_CHUNK
+            return factors[chunk][None, :] / num_honest[:, None]
+
+        log_totals = np.zeros(num_attackers)
+        for start in range(0, len(sources), EVENT_CHUNK):
+            chunk = slice(start, start + EVENT_CHUNK)
+            observed = observed_events(membership, sources[chunk], targets[chunk])
+            log_totals += (np.log1p(chunk_increments(chunk)) * observed).sum(axis=1)
+
+        weights = np.where(
+            membership, 0.0, np.exp(-log_totals)[:, None] / num_honest[:, None]
+        )
+        log_before = np.zeros(num_attackers)
+        for start in range(0, len(sources), EVENT_CHUNK):
+            chunk = slice(start, start + EVENT_CHUNK)
+            observed = observed_events(membership, sources[chunk], targets[chunk])
+            increments = chunk_increments(chunk)
+            log_steps = np.log1p(increments) * observed
+            log_exclusive = (
+                log_before[:, None] + np.cumsum(log_steps, axis=1) - log_steps
+            )
+            log_before += log_steps.sum(axis=1)
+            contributions = (
+                increments * np.exp(log_exclusive - log_totals[:, None]) * observed
+            )
+            one_hot = csr_matrix(
+                (
+                    np.ones(len(sources[chunk])),
+                    (np.arange(len(sources[chunk])), sources[chunk]),
+                ),
+                shape=(len(sources[chunk]), num_nodes),
+            )
+            weights += (one_hot.T @ contributions.T).T
+
+        best = np.argmax(weights, axis=1)
+        best_weights = weights[np.arange(num_attackers), best]
+        return [
+            node_ids[i] if w > 0 else -1 for i, w in zip(best.tolist(), best_weights)
+        ]
 
     def process_all_events(
         self, curious_nodes_events: dict[NodeID, list[Event]]
@@ -100,25 +261,17 @@ class UniformEstimator(Attacker):
 
 class LowestTimeEstimator(Attacker):
     """The LowestTimeEstimator is an attacker that
-    guesses the source according to the message with lowest time."""
+    guesses the source according to the message with lowest time.
+    Only the sender of the earliest observed message is kept: all probability is
+    on it, or uniform over honest peers before any message is observed."""
 
     name: str = "Lowest time estimator"
 
     def __init__(self, node_ids: list[NodeID], curious_node_ids: list[NodeID]):
         super().__init__(node_ids, curious_node_ids)
 
-        # Starts with equal probability
-        uniform_probability = 1 / self.num_honest_peers
-        for peer_id in self.node_ids:
-            if peer_id not in self.curious_node_ids:
-                self.probability[peer_id] = uniform_probability
-
         self.lowest_time = float("inf")
-
-    def set_probabilities_to_zero(self) -> None:
-        """This function set all probabilities to zero"""
-        for i in self.probability:
-            self.probability[i] = 0
+        self.lowest_time_source: NodeID | None = None
 
     def process_event(self, event: Event) -> None:
         # If sender is a curious node, just return
@@ -127,8 +280,57 @@ class LowestTimeEstimator(Attacker):
 
         if event.timestamp < self.lowest_time:
             self.lowest_time = event.timestamp
-            self.set_probabilities_to_zero()
-            self.probability[event.source] = 1
+            self.lowest_time_source = event.source
+
+    def probabilities(self) -> np.ndarray:
+        probabilities = np.zeros(len(self.node_ids))
+        if self.lowest_time_source is None:
+            # Starts with equal probability
+            probabilities[self.honest] = 1 / self.num_honest_peers
+        else:
+            probabilities[self.node_index[self.lowest_time_source]] = 1
+        return probabilities
+
+    def set_weights(self, weights: np.ndarray) -> None:
+        raise TypeError(
+            f"{type(self).__name__} derives its probabilities from the earliest "
+            "observed event, they cannot be set"
+        )
+
+    def guess(self) -> NodeID:
+        if self.lowest_time_source is not None:
+            return self.lowest_time_source
+        # Equal probabilities: the first honest peer
+        honest_indices = np.flatnonzero(self.honest)
+        if len(honest_indices) == 0:
+            return -1
+        return self.node_ids[honest_indices[0]]
+
+    @classmethod
+    def bulk_guess(
+        cls,
+        membership: np.ndarray,
+        node_ids: list[NodeID],
+        sources: np.ndarray,
+        targets: np.ndarray,
+        timestamps: np.ndarray,
+    ) -> list[NodeID]:
+        # Events are in processing (time) order, so the earliest observed event is
+        # the first one, and ties keep the first as with the strict comparison
+        guesses = first_honest_node(membership)
+        pending = np.ones(len(membership), dtype=bool)
+        for start in range(0, len(sources), EVENT_CHUNK):
+            if not pending.any():
+                break
+            chunk_sources = sources[start : start + EVENT_CHUNK]
+            observed = observed_events(
+                membership[pending], chunk_sources, targets[start : start + EVENT_CHUNK]
+            )
+            found = observed.any(axis=1)
+            rows = np.flatnonzero(pending)[found]
+            guesses[rows] = chunk_sources[np.argmax(observed[found], axis=1)]
+            pending[rows] = False
+        return [node_ids[i] for i in guesses.tolist()]
 
     def process_all_events(
         self, curious_nodes_events: dict[NodeID, list[Event]]
@@ -138,14 +340,62 @@ class LowestTimeEstimator(Attacker):
                 self.process_event(event)
 
 
+class AttackerEnsemble:
+    """Attackers of a same class, evaluated together. Their curious nodes are an
+    A x N boolean membership matrix (aligned with node_ids); instead of processing
+    events one by one, the run's event log is given to [process_event_log] at the
+    end and every guess is computed in bulk by the class' bulk_guess."""
+
+    def __init__(
+        self,
+        cls: type[Attacker],
+        node_ids: list[NodeID],
+        curious_node_ids: list[list[NodeID]],
+    ):
+        self.cls = cls
+        self.name = cls.name
+        self.node_ids = node_ids
+        self.node_index: dict[NodeID, int] = {
+            node_id: index for index, node_id in enumerate(node_ids)
+        }
+        self.membership = np.zeros((len(curious_node_ids), len(node_ids)), dtype=bool)
+        for row, curious in enumerate(curious_node_ids):
+            columns = [self.node_index[node_id] for node_id in curious]
+            self.membership[row, columns] = True
+        self.guesses: list[NodeID] = []
+
+    def __len__(self) -> int:
+        return len(self.membership)
+
+    def process_event_log(
+        self, sources: list[NodeID], targets: list[NodeID], timestamps: list[float]
+    ) -> None:
+        """Computes every attacker's guess from the events processed in a run (in
+        processing order)"""
+        node_index = self.node_index
+        self.guesses = self.cls.bulk_guess(
+            self.membership,
+            self.node_ids,
+            np.fromiter((node_index[node_id] for node_id in sources), dtype=np.int64),
+            np.fromiter((node_index[node_id] for node_id in targets), dtype=np.int64),
+            np.asarray(timestamps, dtype=np.float64),
+        )
+
+    def guess(self) -> list[NodeID]:
+        """Returns the guess of each attacker"""
+        return self.guesses
+
+
 def create_random_attackers(
     cls: callable,
     all_nodes: list[NodeID],
     source: NodeID,
     fraction_curious_nodes: float,
     num_attackers: int = 1,
-) -> list[Attacker]:
-    """Creates a list of attackers using the cls creator"""
+    as_ensemble: bool = False,
+) -> list[Attacker | AttackerEnsemble]:
+    """Creates a list of attackers using the cls creator.
+    With [as_ensemble], the list holds a single AttackerEnsemble of all attackers."""
 
     possible_curious_nodes: list[NodeID] = []
     for node in all_nodes:
@@ -153,14 +403,20 @@ def create_random_attackers(
             possible_curious_nodes.append(node)
 
     attackers: list[Attacker] = []
+    all_curious_nodes: list[list[NodeID]] = []
 
     num_curious_nodes = int(fraction_curious_nodes * len(all_nodes))
 
     for _ in range(num_attackers):
-        curious_nodes = possible_curious_nodes.copy()
-        random.shuffle(curious_nodes)
-        curious_nodes = curious_nodes[:num_curious_nodes]
+        curious_nodes = random.sample(
+            possible_curious_nodes, min(num_curious_nodes, len(possible_curious_nodes))
+        )
 
-        attackers.append(cls(all_nodes, curious_nodes))
+        if as_ensemble:
+            all_curious_nodes.append(curious_nodes)
+        else:
+            attackers.append(cls(all_nodes, curious_nodes))
 
+    if as_ensemble:
+        return [AttackerEnsemble(cls, all_nodes, all_curious_nodes)]
     return attackers
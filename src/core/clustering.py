@@ -1,45 +1,219 @@
 """ Clustering """
 
-from sklearn.cluster import KMeans
-import numpy as np
+import os
 from collections import defaultdict
-from utils.basic_types import NodeID
+from dataclasses import dataclass, field
+from functools import cached_property
+
+import numpy as np
+from scipy.spatial import Voronoi
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from utils.basic_types import Node, NodeID
+from utils.cache import LRUCache
 from core.network import Network
+from core.voronoi import voronoi_neighbors
+
+
+@dataclass
+class Clustering:
+    """Clusters of a network's nodes, by node index (position in network.nodes).
+
+    Cluster ids are 0..num_clusters-1; the members of cluster c are
+    member_order[member_offsets[c]:member_offsets[c + 1]]. The Voronoi
+    tessellation of the centroids (and so the neighbours) is only computed when
+    first read.
+    """
+
+    labels: np.ndarray
+    centroids: np.ndarray
+    member_order: np.ndarray = field(init=False, repr=False)
+    member_offsets: np.ndarray = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.member_order = np.argsort(self.labels, kind="stable")
+        counts = np.bincount(self.labels, minlength=len(self.centroids))
+        self.member_offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    @property
+    def num_clusters(self) -> int:
+        return len(self.centroids)
+
+    def members(self, cluster_id: int) -> np.ndarray:
+        """Indices of the nodes in the given cluster"""
+        start, end = self.member_offsets[cluster_id : cluster_id + 2]
+        return self.member_order[start:end]
+
+    @cached_property
+    def voronoi(self) -> Voronoi:
+        """Tessellation of the cluster centroids"""
+        voronoi, neighbors = voronoi_neighbors(self.centroids)
+        if "neighbors" not in vars(self):
+            self.neighbors = neighbors
+        return voronoi
+
+    @cached_property
+    def neighbors(self) -> dict[int, set[int]]:
+        """Voronoi neighbours of every cluster"""
+        return voronoi_neighbors(self.centroids)[1]
+
+    @property
+    def has_neighbors(self) -> bool:
+        """Whether the neighbours were already computed (or loaded)"""
+        return "neighbors" in vars(self)
+
+    @cached_property
+    def neighbor_pools(self) -> tuple[np.ndarray, np.ndarray, list[np.ndarray]]:
+        """Members of every cluster's Voronoi neighbours, as one contiguous array.
+
+        Returns:
+            tuple: the node indices of all pools back to back, the pool offsets
+            (the pool of cluster c is pool[offsets[c]:offsets[c + 1]]) and, per
+            cluster, the offsets within its pool at which each neighbouring
+            cluster's members start (neighbours in ascending order).
+        """
+        cluster_sizes = np.diff(self.member_offsets)
+        pools: list[np.ndarray] = []
+        pool_sizes: list[int] = []
+        segment_offsets: list[np.ndarray] = []
+        for cluster_id in range(self.num_clusters):
+            neighbors = sorted(self.neighbors[cluster_id])
+            sizes = cluster_sizes[neighbors]
+            segment_offsets.append(np.concatenate([[0], np.cumsum(sizes)[:-1]]))
+            pool_sizes.append(int(sizes.sum()))
+            pools.extend(self.members(neighbor) for neighbor in neighbors)
+        pool = np.concatenate(pools) if pools else np.empty(0, dtype=np.int64)
+        return pool, np.concatenate([[0], np.cumsum(pool_sizes)]), segment_offsets
+
+    def neighbor_pairs(self) -> np.ndarray:
+        """Voronoi adjacency as an (E x 2) array of (a, b) pairs with a < b"""
+        pairs = [
+            (a, b) for a, others in self.neighbors.items() for b in others if a < b
+        ]
+        return np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+
+    @classmethod
+    def from_labels(cls, labels: np.ndarray, positions: np.ndarray) -> "Clustering":
+        """Builds the clustering from raw labels, dropping empty clusters"""
+        _, labels = np.unique(labels, return_inverse=True)
+        counts = np.bincount(labels)
+        centroids = (
+            np.stack(
+                [np.bincount(labels, weights=positions[:, axis]) for axis in range(2)],
+                axis=1,
+            )
+            / counts[:, None]
+        )
+        return cls(labels, centroids)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        labels: np.ndarray,
+        centroids: np.ndarray,
+        neighbor_pairs: np.ndarray | None = None,
+    ) -> "Clustering":
+        """Rebuilds a clustering saved with labels/centroids (and neighbor_pairs,
+        if its neighbours had been computed)"""
+        clustering = cls(labels, centroids)
+        if neighbor_pairs is not None:
+            neighbors: dict[int, set[int]] = {c: set() for c in range(len(centroids))}
+            for a, b in neighbor_pairs.tolist():
+                neighbors[a].add(b)
+                neighbors[b].add(a)
+            clustering.neighbors = neighbors
+        return clustering
+
+
+# Clusterings per (network fingerprint, n_clusters, seed, minibatch)
+_clustering_cache = LRUCache(maxsize=16)
+
+
+def cluster_network(
+    network: Network,
+    n_clusters: int = 9,
+    seed: int | None = 0,
+    minibatch: bool = False,
+    cache_dir: str | None = None,
+) -> Clustering:
+    """Clusters the network's node positions using KMeans.
+
+    Results are cached in memory, and under [cache_dir] when given, by the
+    network's fingerprint, [n_clusters], [seed] and [minibatch], so protocols
+    built on the same network share one clustering. A [seed] of None runs an
+    unseeded fit that is never cached.
+
+    Args:
+        network (Network): The network to be clustered.
+        n_clusters (int): The number of clusters.
+        seed (int | None): Random state of the fit.
+        minibatch (bool): Use MiniBatchKMeans, which is much faster on large
+            networks at the cost of slightly worse clusters.
+        cache_dir (str | None): Directory for the on-disk cache.
+
+    Returns:
+        Clustering: Cluster labels, membership arrays and Voronoi neighbours.
+    """
+    cacheable = seed is not None
+    key = (network.fingerprint(), n_clusters, seed, minibatch)
+    if cacheable and key in _clustering_cache:
+        return _clustering_cache.get(key)
+
+    filename = None
+    if cacheable and cache_dir is not None:
+        kind = "minibatch" if minibatch else "kmeans"
+        filename = os.path.join(
+            cache_dir, f"clusters-{key[0]}-{n_clusters}-{seed}-{kind}.npz"
+        )
+
+    if filename is not None and os.path.exists(filename):
+        with np.load(filename) as data:
+            clustering = Clustering.from_arrays(
+                data["labels"],
+                data["centroids"],
+                data["neighbor_pairs"] if "neighbor_pairs" in data.files else None,
+            )
+    else:
+        if minibatch:
+            kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=seed)
+        else:
+            kmeans = KMeans(n_clusters=n_clusters, random_state=seed)
+        labels = kmeans.fit_predict(network.positions)
+        clustering = Clustering.from_labels(labels, network.positions)
+        if filename is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            arrays = {"labels": clustering.labels, "centroids": clustering.centroids}
+            if clustering.has_neighbors:
+                arrays["neighbor_pairs"] = clustering.neighbor_pairs()
+            with open(filename + ".tmp", "wb") as file:
+                np.savez(file, **arrays)
+            os.replace(filename + ".tmp", filename)
+
+    if cacheable:
+        _clustering_cache.put(key, clustering)
+    return clustering
 
 
 def create_cluster_nodes(
-    network: Network, n_clusters: int = 9
-) -> tuple[dict[int, list[NodeID]], dict[NodeID, int]]:
+    network: Network, n_clusters: int = 9, seed: int | None = 0
+) -> tuple[dict[int, list[Node]], dict[NodeID, int]]:
     """
     Clusters nodes in the given network using KMeans.
 
     Args:
         network (Network): The network to be clustered.
-        eps (float): The maximum distance between two samples for them to be considered in the same neighborhood.
-        min_samples (int): The number of samples (or total weight) in a neighborhood for a point to be considered as a core point.
+        n_clusters (int): The number of clusters.
+        seed (int | None): Random state of the fit (see cluster_network).
 
     Returns:
-        dict[int, list[Node]]: A dictionary mapping cluster IDs to lists of nodes in that cluster.
+        tuple: A dictionary mapping cluster IDs to lists of nodes in that
+        cluster, and a dictionary mapping node IDs to their cluster ID.
     """
-    # Extract positions as a 2D array for clustering
-    positions = np.array([[node.pos.x, node.pos.y] for node in network.nodes])
-
-    kmeans = KMeans(n_clusters=n_clusters)
-    clustering = kmeans.fit(positions)
+    clustering = cluster_network(network, n_clusters=n_clusters, seed=seed)
 
-    cluster_map: dict[int, list[NodeID]] = defaultdict(list)
+    cluster_map: dict[int, list[Node]] = defaultdict(list)
     node_to_cluster_map: dict[NodeID, int] = {}
-    for node, cluster_label in zip(network.nodes, clustering.labels_):
+    for node, cluster_label in zip(network.nodes, clustering.labels.tolist()):
         cluster_map[cluster_label].append(node)
         node_to_cluster_map[node.node_id] = cluster_label
 
-    # y = [node.pos.x for node in network.nodes]
-    # x = [node.pos.y for node in network.nodes]
-    # plt.scatter(x, y, c = kmeans.labels_)
-    # plt.show()
-
-    # Remove noise cluster (label == -1)
-    if -1 in cluster_map:
-        del cluster_map[-1]
-
     return cluster_map, node_to_cluster_map
@@ -0,0 +1,121 @@
+""" Event queues for the simulator """
+
+import abc
+import heapq
+import itertools
+
+import numpy as np
+from utils.basic_types import NodeID
+
+
+class EventQueue(abc.ABC):
+    """Priority queue of network events ordered by (timestamp, seq).
+    Events are (timestamp, seq, source, target) tuples, where seq is the insertion
+    order and breaks ties between equal timestamps."""
+
+    @abc.abstractmethod
+    def push(self, timestamp: float, source: NodeID, target: NodeID) -> None:
+        """Adds an event"""
+
+    def push_many(
+        self, timestamps: list[float], source: NodeID, targets: list[NodeID]
+    ) -> None:
+        """Adds one event from [source] to each of [targets]"""
+        for timestamp, target in zip(timestamps, targets):
+            self.push(timestamp, source, target)
+
+    @abc.abstractmethod
+    def pop(self) -> tuple[float, int, NodeID, NodeID]:
+        """Removes and returns the earliest event"""
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        """Number of queued events"""
+
+
+class HeapEventQueue(EventQueue):
+    """Binary heap (heapq) of event tuples"""
+
+    def __init__(self):
+        self.heap: list[tuple[float, int, NodeID, NodeID]] = []
+        self.counter = itertools.count()
+
+    def push(self, timestamp: float, source: NodeID, target: NodeID) -> None:
+        heapq.heappush(self.heap, (timestamp, next(self.counter), source, target))
+
+    def push_many(
+        self, timestamps: list[float], source: NodeID, targets: list[NodeID]
+    ) -> None:
+        heap = self.heap
+        counter = self.counter
+        for timestamp, target in zip(timestamps, targets):
+            heapq.heappush(heap, (timestamp, next(counter), source, target))
+
+    def pop(self) -> tuple[float, int, NodeID, NodeID]:
+        return heapq.heappop(self.heap)
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+
+class ArrayEventQueue(EventQueue):
+    """Struct-of-arrays queue: sources and targets live in preallocated numpy buffers
+    indexed by seq, and the heap only holds (timestamp, seq) keys.
+    When the buffers are full, live events are renumbered in order (which keeps the
+    tie-breaking order) if at most half of them are in use, otherwise the buffers
+    double in size."""
+
+    def __init__(self, capacity: int = 1 << 12):
+        self.heap: list[tuple[float, int]] = []
+        self.sources = np.empty(capacity, dtype=np.int64)
+        self.targets = np.empty(capacity, dtype=np.int64)
+        self.next_seq = 0
+
+    def reserve(self, num_events: int) -> None:
+        """Makes room for [num_events] new events by compacting or growing the buffers"""
+        capacity = len(self.sources)
+        if self.next_seq + num_events <= capacity:
+            return
+        if len(self.heap) + num_events <= capacity // 2:
+            self.heap.sort()
+            seqs = [seq for _, seq in self.heap]
+            num_live = len(seqs)
+            self.sources[:num_live] = self.sources[seqs]
+            self.targets[:num_live] = self.targets[seqs]
+            self.heap = [(timestamp, i) for i, (timestamp, _) in enumerate(self.heap)]
+            self.next_seq = num_live
+            return
+        while self.next_seq + num_events > capacity:
+            capacity *= 2
+        for name in ("sources", "targets"):
+            buffer = np.empty(capacity, dtype=np.int64)
+            buffer[: self.next_seq] = getattr(self, name)[: self.next_seq]
+            setattr(self, name, buffer)
+
+    def push(self, timestamp: float, source: NodeID, target: NodeID) -> None:
+        self.reserve(1)
+        seq = self.next_seq
+        self.sources[seq] = source
+        self.targets[seq] = target
+        self.next_seq += 1
+        heapq.heappush(self.heap, (timestamp, seq))
+
+    def push_many(
+        self, timestamps: list[float], source: NodeID, targets: list[NodeID]
+    ) -> None:
+        num_events = len(targets)
+        self.reserve(num_events)
+        start = self.next_seq
+        self.sources[start : start + num_events] = source
+        self.targets[start : start + num_events] = targets
+        self.next_seq += num_events
+        heap = self.heap
+        for seq, timestamp in enumerate(timestamps, start):
+            heapq.heappush(heap, (timestamp, seq))
+
+    def pop(self) -> tuple[float, int, NodeID, NodeID]:
+        timestamp, seq = heapq.heappop(self.heap)
+        return timestamp, seq, int(self.sources[seq]), int(self.targets[seq])
+
+    def __len__(self) -> int:
+        return len(self.heap)
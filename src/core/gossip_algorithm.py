@@ -1,14 +1,16 @@
 """Gossip Algorithm"""
 
 import abc
+from functools import cached_property
 import random
+import warnings
 
 import numpy as np
-from core.clustering import create_cluster_nodes
+from scipy.spatial.distance import cdist
+from core.clustering import Clustering, cluster_network
 from core.network import Network
-from core.voronoi import create_voronoi
-from utils.basic_types import Node, NodeID
-from utils.position import CoordinateSystemPoint
+from utils.basic_types import NodeID
+from utils.cache import LRUCache
 from utils.probability import (
     select_from_group,
     select_samples_from_group_without_replacement,
@@ -27,6 +29,17 @@ class GossipAlgorithm(abc.ABC):
     def select_targets(self, node_id: NodeID) -> list[NodeID]:
         """Given that [node_id] just received a message, returns a list of nodes for it to propagate the message"""
 
+    def batch_select_targets(
+        self, senders: np.ndarray, rng: np.random.Generator
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Vectorized select_targets over node indices (positions in network.nodes),
+        for protocols whose choice does not depend on the message history.
+        Returns (rows, targets), where targets[i] is a node index chosen by
+        senders[rows[i]]."""
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support vectorized target selection"
+        )
+
 
 class RandomWalk(GossipAlgorithm):
     """RandomWalk"""
@@ -37,6 +50,12 @@ class RandomWalk(GossipAlgorithm):
     def select_targets(self, node_id: NodeID) -> list[NodeID]:
         return [np.random.choice(self.node_ids)]
 
+    def batch_select_targets(
+        self, senders: np.ndarray, rng: np.random.Generator
+    ) -> tuple[np.ndarray, np.ndarray]:
+        rows = np.arange(len(senders))
+        return rows, rng.integers(0, len(self.node_ids), size=len(senders))
+
 
 class CobraWalk(GossipAlgorithm):
     """CobraWalk"""
@@ -59,21 +78,57 @@ class CobraWalk(GossipAlgorithm):
 
         return [target1]
 
+    def batch_select_targets(
+        self, senders: np.ndarray, rng: np.random.Generator
+    ) -> tuple[np.ndarray, np.ndarray]:
+        num_senders = len(senders)
+        targets1 = rng.integers(0, len(self.node_ids), size=num_senders)
+        targets2 = rng.integers(0, len(self.node_ids), size=num_senders)
+        second = (rng.random(num_senders) <= self.rho) & (targets1 != targets2)
+        rows = np.concatenate([np.arange(num_senders), np.flatnonzero(second)])
+        return rows, np.concatenate([targets1, targets2[second]])
+
+
+def map_cluster_node_ids(
+    clustering: Clustering, node_ids: list[NodeID]
+) -> tuple[dict[int, list[NodeID]], dict[NodeID, int]]:
+    """Maps each cluster to its members' ids, and each node id to its cluster"""
+    node_ids_array = np.array(node_ids)
+    clusters = {
+        cluster_id: node_ids_array[clustering.members(cluster_id)].tolist()
+        for cluster_id in range(clustering.num_clusters)
+    }
+    return clusters, dict(zip(node_ids, clustering.labels.tolist()))
+
 
 class HierarchialGossip(GossipAlgorithm):
     """HierarchialGossip"""
 
     def __init__(
-        self, network, fanout_intra: int, fanout_inter: int, num_clusters: int
+        self,
+        network,
+        fanout_intra: int,
+        fanout_inter: int,
+        num_clusters: int,
+        seed: int | None = 0,
+        minibatch: bool = False,
+        cache_dir: str | None = None,
     ):
         super().__init__(network)
-        self.clusters, self.node_cluster = create_cluster_nodes(
-            self.network, n_clusters=num_clusters
+        self.clustering = cluster_network(
+            self.network, num_clusters, seed, minibatch, cache_dir
+        )
+        self.clusters, self.node_cluster = map_cluster_node_ids(
+            self.clustering, self.node_ids
         )
-        # Change ClusterID -> []Node to ClusterID -> []NodeID
-        for cluster_id, cluster_nodes in self.clusters.items():
-            node_ids = [node.node_id for node in cluster_nodes]
-            self.clusters[cluster_id] = node_ids
+
+        # Pre-compute, for each cluster, the nodes outside of it
+        self.cluster_complements: dict[int, list[NodeID]] = {}
+        for cluster_id, cluster_node_ids in self.clusters.items():
+            members = set(cluster_node_ids)
+            self.cluster_complements[cluster_id] = [
+                node_id for node_id in self.node_ids if node_id not in members
+            ]
 
         self.fanout_intra = fanout_intra
         self.fanout_inter = fanout_inter
@@ -86,88 +141,151 @@ class HierarchialGossip(GossipAlgorithm):
             self.clusters[node_cluster_id], k=self.fanout_intra
         )
 
-        outside_nodes = [
-            node_id
-            for node_id in self.node_ids
-            if node_id not in self.clusters[node_cluster_id]
-        ]
         inter_targets = select_samples_from_group_without_replacement(
-            outside_nodes, k=self.fanout_inter
+            self.cluster_complements[node_cluster_id], k=self.fanout_inter
         )
         return intra_targets + inter_targets
 
 
+# Pairwise distances per network fingerprint, and spatial gossip CDFs per
+# (fingerprint, dimension, rho, dtype). Both are N x N, so each cache is also
+# bounded by the total size of its matrices.
+SPATIAL_CACHE_BYTES = 2**30
+_distance_cache = LRUCache(maxsize=4, max_bytes=SPATIAL_CACHE_BYTES)
+_spatial_cdf_cache = LRUCache(maxsize=16, max_bytes=SPATIAL_CACHE_BYTES)
+
+
+def clear_spatial_caches() -> None:
+    """Releases the cached distance matrices and spatial gossip CDFs"""
+    _distance_cache.clear()
+    _spatial_cdf_cache.clear()
+
+
+def spatial_gossip_cdf(
+    network: Network,
+    dimension: int,
+    rho: float,
+    dtype: type = np.float64,
+    cache: bool = True,
+) -> np.ndarray:
+    """Returns the N x N row-wise cumulative spatial gossip probabilities, where the
+    probability of [i] choosing [j] is proportional to (distance + 1)^(-dimension * rho)
+    and a node never chooses itself. With [cache], results (and the distance matrix)
+    are cached; see clear_spatial_caches."""
+    fingerprint = network.fingerprint()
+    key = (fingerprint, dimension, rho, np.dtype(dtype).name)
+    cdf = _spatial_cdf_cache.get(key) if cache else None
+    if cdf is not None:
+        return cdf
+
+    distances = _distance_cache.get(fingerprint) if cache else None
+    if distances is None:
+        distances = cdist(network.positions, network.positions)
+        if cache:
+            _distance_cache.put(fingerprint, distances)
+
+    probabilities = (distances + 1) ** (-dimension * rho)
+    np.fill_diagonal(probabilities, 0)
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    cdf = np.cumsum(probabilities, axis=1).astype(dtype, copy=False)
+    if cache:
+        # Shared by every SpatialGossip over the same network
+        cdf.flags.writeable = False
+        _spatial_cdf_cache.put(key, cdf)
+    return cdf
+
+
 class SpatialGossip(GossipAlgorithm):
     """SpatialGossip"""
 
-    def __init__(self, network, dimension: int, rho: float):
+    def __init__(
+        self,
+        network,
+        dimension: int,
+        rho: float,
+        dtype: type = np.float64,
+        cache: bool = True,
+    ):
+        # The CDF is a dense N x N matrix, like the latencies of a dense Network
+        network.require_dense(type(self).__name__)
         super().__init__(network)
         self.dimension: int = dimension
         self.rho: float = rho
 
-        # Pre-compute probabilities
-        self.spatial_gossip_vectors: dict[NodeID, dict[NodeID, float]] = {}
-        for node in self.network.nodes:
-            self.spatial_gossip_vectors[node.node_id] = (
-                self.get_spatial_gossip_probability_vector(
-                    self.network, node, dimension=self.dimension, rho=self.rho
-                )
-            )
-
-    def select_targets(self, node_id: NodeID) -> list[NodeID]:
-        return [
-            np.random.choice(
-                list(self.spatial_gossip_vectors[node_id].keys()),
-                p=list(self.spatial_gossip_vectors[node_id].values()),
-            )
-        ]
-
-    def calculate_probability(
-        self, node: Node, other_node: Node, dimension: int, rho: float
-    ) -> float:
-        """Computes the probability associated to the distance of two nodes"""
-        distance_vector: CoordinateSystemPoint = node.pos - other_node.pos
-        distance = distance_vector.norm()
-        return (distance + 1) ** (-dimension * rho)
-
-    def get_spatial_gossip_probability_vector(
-        self, network: Network, node: Node, dimension: int, rho: float
-    ) -> dict[NodeID, float]:
-        """Computes the probability of choosing a neighbour for all nodes with [node] as source"""
-        probs: dict[NodeID, float] = {}
-        for target in network.nodes:
-            if target.node_id == node.node_id:
-                continue
-            probs[target.node_id] = self.calculate_probability(
-                node, target, dimension, rho
-            )
+        # Cumulative probabilities per source, aligned with the network's node index,
+        # so each draw is a binary search on the source's row. Without [cache], the
+        # matrix is owned by this instance and freed with it.
+        self.cumulative_probabilities: np.ndarray = spatial_gossip_cdf(
+            self.network,
+            dimension=self.dimension,
+            rho=self.rho,
+            dtype=dtype,
+            cache=cache,
+        )
 
-        # Normalize
-        total_sum = sum(list(probs.values()))
-        for key, value in probs.items():
-            probs[key] = value / total_sum
+    @cached_property
+    def spatial_gossip_vectors(self) -> dict[NodeID, dict[NodeID, float]]:
+        """Probability of choosing each neighbour, per source node.
+
+        Deprecated: this builds N^2 Python objects (once, then cached). Use the
+        rows of [cumulative_probabilities] instead."""
+        warnings.warn(
+            "SpatialGossip.spatial_gossip_vectors is deprecated, use "
+            "cumulative_probabilities",
+            DeprecationWarning,
+            stacklevel=3,
+        )
+        probabilities = np.diff(self.cumulative_probabilities, axis=1, prepend=0)
+        return {
+            node_id: {
+                target: float(probability)
+                for target, probability in zip(self.node_ids, row.tolist())
+                if target != node_id
+            }
+            for node_id, row in zip(self.node_ids, probabilities)
+        }
+
+    def sample_targets(self, node_id: NodeID, k: int = 1) -> list[NodeID]:
+        """Draws [k] targets (with replacement) from the spatial distribution of [node_id]"""
+        cdf = self.cumulative_probabilities[self.network.node_index[node_id]]
+        # Queries in the CDF's dtype, so float32 rows are not cast on every draw, and
+        # strictly below the row's total, as a query rounded up to it would select
+        # a trailing target of zero probability (such as the source itself)
+        total = cdf[-1]
+        queries = (np.random.random(k) * total).astype(cdf.dtype, copy=False)
+        np.minimum(queries, np.nextafter(total, total.dtype.type(0)), out=queries)
+        indices = np.searchsorted(cdf, queries, side="right")
+        return [self.node_ids[index] for index in indices.tolist()]
 
-        return probs
+    def select_targets(self, node_id: NodeID) -> list[NodeID]:
+        return self.sample_targets(node_id)
 
 
 class SpatialGossipWithCobraWalk(SpatialGossip):
     """SpatialGossip"""
 
-    def __init__(self, network, dimension: int, rho: float, cobra_walk_rho):
-        super().__init__(network, dimension, rho)
+    def __init__(
+        self,
+        network,
+        dimension: int,
+        rho: float,
+        cobra_walk_rho,
+        dtype: type = np.float64,
+        cache: bool = True,
+    ):
+        super().__init__(network, dimension, rho, dtype, cache)
         self.cobra_walk_rho: float = cobra_walk_rho
 
     def select_targets(self, node_id: NodeID) -> list[NodeID]:
-        target1: list[NodeID] = super().select_targets(node_id)
-
         random_value = random.random()
         cobra_partition = random_value <= self.cobra_walk_rho
         if cobra_partition:
-            target2: list[NodeID] = super().select_targets(node_id)
-            if target1[0] != target2[0]:
-                return target1 + target2
+            targets = self.sample_targets(node_id, k=2)
+            if targets[0] != targets[1]:
+                return targets
+            return targets[:1]
 
-        return target1
+        return self.sample_targets(node_id)
 
 
 class HierarchicalIntraCobraWalkInterBernoulliWithVoronoi(GossipAlgorithm):
@@ -180,50 +298,72 @@ class HierarchicalIntraCobraWalkInterBernoulliWithVoronoi(GossipAlgorithm):
         intra_cobra_walk_rho: float,
         fanout_inter: int,
         num_clusters: int,
+        seed: int | None = 0,
+        minibatch: bool = False,
+        cache_dir: str | None = None,
     ):
         super().__init__(network)
-        self.clusters, self.node_cluster = create_cluster_nodes(
-            self.network, n_clusters=num_clusters
+        self.clustering = cluster_network(
+            self.network, num_clusters, seed, minibatch, cache_dir
         )
-        self.voronoi, self.voronoi_neighbors = create_voronoi(self.clusters)
-
-        # Change ClusterID -> []Node to ClusterID -> []NodeID
-        for cluster_id, cluster_nodes in self.clusters.items():
-            node_ids = [node.node_id for node in cluster_nodes]
-            self.clusters[cluster_id] = node_ids
+        self.clusters, self.node_cluster = map_cluster_node_ids(
+            self.clustering, self.node_ids
+        )
+        self.voronoi_neighbors = self.clustering.neighbors
+
+        # Members of each cluster, and of each cluster's Voronoi neighbours, as
+        # contiguous id lists indexed through offsets, so targets are drawn by
+        # sampling positions instead of building and shuffling candidate lists
+        node_ids_array = np.array(self.node_ids)
+        self.member_ids: list[NodeID] = node_ids_array[
+            self.clustering.member_order
+        ].tolist()
+        self.member_offsets: list[int] = self.clustering.member_offsets.tolist()
+        pool, pool_offsets, _ = self.clustering.neighbor_pools
+        self.neighbor_pool_ids: list[NodeID] = node_ids_array[pool].tolist()
+        self.neighbor_pool_offsets: list[int] = pool_offsets.tolist()
 
         self.inter_cluster_probability = inter_cluster_probability
         self.intra_cobra_walk_rho = intra_cobra_walk_rho
         self.fanout_inter = fanout_inter
 
+    @property
+    def voronoi(self):
+        """Tessellation of the cluster centroids"""
+        return self.clustering.voronoi
+
     def select_targets(self, node_id: NodeID) -> list[NodeID]:
 
         # Intra cluster: cobra walk
         node_cluster_id = self.node_cluster[node_id]
-        intra_targets: list[NodeID] = []
+        members = range(
+            self.member_offsets[node_cluster_id],
+            self.member_offsets[node_cluster_id + 1],
+        )
+        member_ids = self.member_ids
         if bernoulli_event(self.intra_cobra_walk_rho):
-            intra_targets = select_samples_from_group_without_replacement(
-                self.clusters[node_cluster_id], k=2
-            )
+            targets = [
+                member_ids[i]
+                for i in select_samples_from_group_without_replacement(members, k=2)
+            ]
         else:
-            intra_targets = [select_from_group(self.clusters[node_cluster_id])]
+            targets = [member_ids[select_from_group(members)]]
 
-        # Inter cluster: bernoulli
-        inter_targets: list[NodeID] = []
+        # Inter cluster: bernoulli, among the members of the Voronoi neighbours
         if bernoulli_event(self.inter_cluster_probability):
-            # Take voronoi neighbours
-            neighbour_clusters = self.voronoi_neighbors[node_cluster_id]
-
-            # Take all possible targets
-            possible_targets: list[NodeID] = []
-            for neighbour_cluster in neighbour_clusters:
-                possible_targets += self.clusters[neighbour_cluster]
-
-            inter_targets = select_samples_from_group_without_replacement(
-                possible_targets, k=self.fanout_inter
+            pool = range(
+                self.neighbor_pool_offsets[node_cluster_id],
+                self.neighbor_pool_offsets[node_cluster_id + 1],
             )
+            pool_ids = self.neighbor_pool_ids
+            targets += [
+                pool_ids[i]
+                for i in select_samples_from_group_without_replacement(
+                    pool, k=self.fanout_inter
+                )
+            ]
 
-        return intra_targets + inter_targets
+        return targets
 
 
 class GossipSub(GossipAlgorithm):
@@ -237,3 +377,31 @@ class GossipSub(GossipAlgorithm):
         return select_samples_from_group_without_replacement(
             self.node_ids, k=self.fanout
         )
+
+    def batch_select_targets(
+        self, senders: np.ndarray, rng: np.random.Generator
+    ) -> tuple[np.ndarray, np.ndarray]:
+        num_nodes = len(self.node_ids)
+        num_senders = len(senders)
+        k = min(self.fanout, num_nodes)
+        if k * k <= num_nodes:
+            # Collisions are rare: draw with replacement and redraw rows with one
+            targets = rng.integers(0, num_nodes, size=(num_senders, k))
+            while True:
+                ordered = np.sort(targets, axis=1)
+                repeated = (ordered[:, 1:] == ordered[:, :-1]).any(axis=1)
+                if not repeated.any():
+                    break
+                targets[repeated] = rng.integers(
+                    0, num_nodes, size=(int(repeated.sum()), k)
+                )
+        else:
+            # Smallest k of random keys, in chunks of rows to bound memory
+            targets = np.empty((num_senders, k), dtype=np.int64)
+            chunk = max(1, (1 << 22) // num_nodes)
+            for start in range(0, num_senders, chunk):
+                keys = rng.random((min(chunk, num_senders - start), num_nodes))
+                targets[start : start + chunk] = np.argpartition(keys, k - 1, axis=1)[
+                    :, :k
+                ]
+        return np.repeat(np.arange(num_senders), k), targets.ravel()
@@ -0,0 +1,204 @@
+""" Opt-in instrumentation of the simulator's hot paths """
+
+import cProfile
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+import os
+import time
+
+from core.attacker import Attacker, AttackerEnsemble
+from core.simulator import Simulator
+from utils.metrics import Metric
+
+# Instrumented methods, by phase: (attribute of the simulator, or None for the
+# run's attackers, method names)
+PHASES: dict[str, tuple[str | None, tuple[str, ...]]] = {
+    "select_targets": ("gossip_algorithm", ("select_targets",)),
+    "delays": ("network", ("get_delay", "get_delays")),
+    "attackers": (None, ("process_event", "process_event_log")),
+}
+
+
+@dataclass
+class RunProfile:
+    """Timings and event counters of instrumented runs"""
+
+    runs: int = 0
+    wall_time: float = 0
+    phase_times: dict[str, float] = field(
+        default_factory=lambda: dict.fromkeys(PHASES, 0.0)
+    )
+    phase_calls: dict[str, int] = field(
+        default_factory=lambda: dict.fromkeys(PHASES, 0)
+    )
+    events_pushed: int = 0
+    events_processed: int = 0
+    events_pruned: int = 0
+    events_dropped: int = 0
+    peak_queue_size: int = 0
+
+    @property
+    def events_popped(self) -> int:
+        return self.events_processed + self.events_dropped
+
+    @property
+    def events_per_second(self) -> float:
+        return self.events_processed / self.wall_time if self.wall_time else 0.0
+
+    @property
+    def other_time(self) -> float:
+        """Time outside of the instrumented phases (queue, counters, metrics)"""
+        return self.wall_time - sum(self.phase_times.values())
+
+    def merge(self, other: "RunProfile") -> "RunProfile":
+        """Sums two profiles (the peak queue size is the largest of both)"""
+        return RunProfile(
+            runs=self.runs + other.runs,
+            wall_time=self.wall_time + other.wall_time,
+            phase_times={
+                phase: self.phase_times[phase] + other.phase_times[phase]
+                for phase in PHASES
+            },
+            phase_calls={
+                phase: self.phase_calls[phase] + other.phase_calls[phase]
+                for phase in PHASES
+            },
+            events_pushed=self.events_pushed + other.events_pushed,
+            events_processed=self.events_processed + other.events_processed,
+            events_pruned=self.events_pruned + other.events_pruned,
+            events_dropped=self.events_dropped + other.events_dropped,
+            peak_queue_size=max(self.peak_queue_size, other.peak_queue_size),
+        )
+
+    def to_dict(self) -> dict:
+        """Flat representation, e.g. for a DataFrame row"""
+        row = {
+            name: value
+            for name, value in asdict(self).items()
+            if name not in ("phase_times", "phase_calls")
+        }
+        for phase in PHASES:
+            row[f"time_{phase}"] = self.phase_times[phase]
+            row[f"calls_{phase}"] = self.phase_calls[phase]
+        row["time_other"] = self.other_time
+        row["events_popped"] = self.events_popped
+        row["events_per_second"] = self.events_per_second
+        return row
+
+
+def _timed(function: Callable, phase: str, profile: RunProfile) -> Callable:
+    """Wraps [function], adding its time and call count to [phase]"""
+    perf_counter = time.perf_counter
+    phase_times = profile.phase_times
+    phase_calls = profile.phase_calls
+
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            phase_times[phase] += perf_counter() - start
+            phase_calls[phase] += 1
+
+    return wrapper
+
+
+class Instrumentation:
+    """Times a simulator's hot paths (target selection, delays and attackers) and
+    optionally profiles its runs.
+
+    The timers are attached by shadowing the methods on the instances with timed
+    wrappers for the duration of run(), and removed afterwards, so runs that are
+    not instrumented execute the original code without any extra branching.
+    With a [profile_dir], every run is also profiled with cProfile (saved as
+    <name>.prof) or pyinstrument (<name>.html, if installed).
+    """
+
+    def __init__(
+        self,
+        simulator: Simulator,
+        profile_dir: str | None = None,
+        profiler: str = "cprofile",
+    ):
+        if profiler not in ("cprofile", "pyinstrument"):
+            raise ValueError(f"Unknown profiler {profiler!r}")
+        self.simulator = simulator
+        self.profile_dir = profile_dir
+        self.profiler = profiler
+        self.last_profile: RunProfile | None = None
+        self.total = RunProfile()
+        self._patched: list[tuple[object, str]] = []
+
+    def attach(
+        self, profile: RunProfile, attackers: list[Attacker | AttackerEnsemble] = []
+    ) -> None:
+        """Shadows the instrumented methods with timers adding to [profile]"""
+        for phase, (owner, names) in PHASES.items():
+            targets = attackers if owner is None else [getattr(self.simulator, owner)]
+            for target in targets:
+                for name in names:
+                    # Skip missing methods and objects already patched (shared
+                    # between phases or passed twice)
+                    if not hasattr(target, name) or name in vars(target):
+                        continue
+                    setattr(target, name, _timed(getattr(target, name), phase, profile))
+                    self._patched.append((target, name))
+
+    def detach(self) -> None:
+        """Restores the original methods"""
+        for target, name in self._patched:
+            delattr(target, name)
+        self._patched = []
+
+    def run(
+        self,
+        attackers: list[Attacker | AttackerEnsemble] = [],
+        name: str = "run",
+        **run_kwargs,
+    ) -> tuple[Metric, Metric]:
+        """Executes simulator.run with the timers attached. The run's profile is
+        kept in [last_profile] and added to [total]."""
+        profile = RunProfile(runs=1)
+        self.attach(profile, attackers)
+        profiler = None
+        if self.profile_dir is not None:
+            if self.profiler == "pyinstrument":
+                from pyinstrument import Profiler
+
+                profiler = Profiler()
+                start_profiler, stop_profiler = profiler.start, profiler.stop
+            else:
+                profiler = cProfile.Profile()
+                start_profiler, stop_profiler = profiler.enable, profiler.disable
+
+        try:
+            start = time.perf_counter()
+            if profiler is not None:
+                start_profiler()
+            try:
+                result = self.simulator.run(attackers=attackers, **run_kwargs)
+            finally:
+                if profiler is not None:
+                    stop_profiler()
+                profile.wall_time = time.perf_counter() - start
+        finally:
+            self.detach()
+
+        if profiler is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            filename = os.path.join(self.profile_dir, name)
+            if self.profiler == "pyinstrument":
+                with open(filename + ".html", "w") as file:
+                    file.write(profiler.output_html())
+            else:
+                profiler.dump_stats(filename + ".prof")
+
+        stats = self.simulator.last_run_stats
+        profile.events_pushed = stats.events_pushed
+        profile.events_processed = stats.events_processed
+        profile.events_pruned = stats.events_pruned
+        profile.events_dropped = stats.events_dropped
+        profile.peak_queue_size = stats.peak_queue_size
+        self.last_profile = profile
+        self.total = self.total.merge(profile)
+        return result
@@ -1,41 +1,154 @@
 """ Network """
 
+from collections.abc import Callable, Mapping, Sequence
+import hashlib
+import json
+import os
 import numpy as np
 import pandas as pd
+from scipy.spatial.distance import cdist
 from utils.basic_types import Node, NodeID, Ping
+from utils.probability import HalfNormalSampler
 import random
-from utils.position import CoordinateSystemPoint, Euclidean2D
+from utils.position import Euclidean2D
 from matplotlib import pyplot as plt
 
 
 class Network:
-    """Network"""
+    """Network
+
+    Latencies are kept in two dense N x N matrices (`base` and `std_dev`), indexed by
+    the position of each node in `nodes`. Missing pairs are marked with inf (NaN is
+    accepted as well and converted to inf). The `pings` attribute is a read/write
+    dict-like view on top of the matrices. Node positions are kept in the N x 2
+    `positions` array; the generated networks hold their nodes as a NodesView,
+    which only creates Node objects when they are accessed.
+    """
+
+    # Whether the `base` and `std_dev` matrices exist (see SparseNetwork)
+    dense: bool = True
 
     def __init__(
-        self, nodes: list[Node], pings: dict[NodeID, dict[NodeID, Ping]] = None
+        self,
+        nodes: Sequence[Node],
+        pings: dict[NodeID, dict[NodeID, Ping]] = None,
+        base: np.ndarray = None,
+        std_dev: np.ndarray = None,
+        dtype: type = np.float64,
+        seed: int | None = None,
     ):
         self.nodes = nodes
-        self.pings = pings
+        self.jitter = HalfNormalSampler(seed)
+        self._fingerprint: str | None = None
+        if isinstance(nodes, NodesView):
+            node_ids = nodes.node_ids.tolist()
+            self.positions = np.asarray(nodes.positions, dtype=np.float64)
+        else:
+            node_ids = [node.node_id for node in nodes]
+            self.positions = np.array(
+                [[node.pos.x, node.pos.y] for node in nodes], dtype=np.float64
+            ).reshape(len(nodes), 2)
+        self.node_index: dict[NodeID, int] = {
+            node_id: index for index, node_id in enumerate(node_ids)
+        }
+
+        num_nodes = len(nodes)
+        if base is None:
+            base = np.full((num_nodes, num_nodes), np.inf, dtype=dtype)
+            std_dev = np.zeros((num_nodes, num_nodes), dtype=dtype)
+            for source, row in (pings or {}).items():
+                i = self.node_index[source]
+                for destination, ping in row.items():
+                    j = self.node_index[destination]
+                    base[i, j] = ping.base
+                    std_dev[i, j] = ping.std_dev
+        elif std_dev is None:
+            std_dev = np.zeros_like(base, dtype=dtype)
+
+        self.base = np.ascontiguousarray(base, dtype=dtype)
+        self.std_dev = np.ascontiguousarray(std_dev, dtype=dtype)
+        if self.base.shape != (num_nodes, num_nodes) or self.std_dev.shape != (
+            num_nodes,
+            num_nodes,
+        ):
+            raise ValueError(
+                f"Latency matrices must have shape ({num_nodes}, {num_nodes})"
+            )
+        # NaN marks a missing pair, the same as inf
+        missing = np.isnan(self.base)
+        if missing.any():
+            self.base = np.where(missing, np.inf, self.base).astype(dtype)
+        if not np.isfinite(self.std_dev).all():
+            self.std_dev = np.nan_to_num(self.std_dev, nan=0.0, posinf=0.0, neginf=0.0)
+
+    def fingerprint(self) -> str:
+        """Hash of the node ids and positions, identifying the network's layout"""
+        if self._fingerprint is None:
+            sha1 = hashlib.sha1()
+            sha1.update(np.array(list(self.node_index)).tobytes())
+            sha1.update(self.positions.tobytes())
+            self._fingerprint = sha1.hexdigest()
+        return self._fingerprint
+
+    def require_dense(self, user: str) -> None:
+        """Raises TypeError if the network has no dense latency matrices, which
+        [user] reads directly"""
+        if not self.dense:
+            raise TypeError(
+                f"{user} reads the dense base/std_dev latency matrices, which a "
+                f"{type(self).__name__} does not build; use a dense Network"
+            )
+
+    @property
+    def pings(self) -> "PingsView":
+        """Dict-like view (NodeID -> NodeID -> Ping) over the latency matrices"""
+        return PingsView(self)
+
+    def get_ping(self, i: int, j: int) -> Ping:
+        """Latency between two node indices"""
+        return Ping(float(self.base[i, j]), float(self.std_dev[i, j]))
 
     @classmethod
-    def randomize(cls, num_nodes: int, grid_size: int):
-        nodes: list[Node] = []
-        for i in range(num_nodes):
-            x = random.randint(-grid_size // 2, grid_size // 2)
-            y = random.randint(-grid_size // 2, grid_size // 2)
-            node = Node(i, pos=Euclidean2D(x, y))
-            nodes.append(node)
-        pings = {
-            node1.node_id: {node2.node_id: Ping(float("inf"), 0) for node2 in nodes}
-            for node1 in nodes
-        }
-        for i in range(num_nodes):
-            for j in range(num_nodes):
-                if i == j:
-                    continue
-                csp: CoordinateSystemPoint = nodes[i].pos - nodes[j].pos
-                pings[i][j] = Ping(csp.norm(), 0.1)
-        return cls(nodes, pings)
+    def randomize(
+        cls,
+        num_nodes: int,
+        grid_size: int,
+        seed: int | None = None,
+        std_dev: float | Callable[[np.random.Generator, tuple], np.ndarray] = 0.1,
+        jitter: Callable[[np.random.Generator, tuple], np.ndarray] | None = None,
+        dtype: type = np.float64,
+    ):
+        """Creates a network with nodes uniformly placed on an integer grid.
+
+        Args:
+            num_nodes (int): Number of nodes.
+            grid_size (int): Side of the grid, centered at the origin.
+            seed (int | None): Seed for the coordinates and distributions.
+            std_dev (float | callable): Delay standard deviation of every pair, or a
+                function (rng, shape) -> array drawing one per pair.
+            jitter (callable | None): Optional function (rng, shape) -> array with an
+                additive perturbation of the base delays.
+            dtype (type): Floating point type of the latency matrices.
+        """
+        rng = np.random.default_rng(seed)
+        positions = rng.integers(
+            -grid_size // 2, grid_size // 2, size=(num_nodes, 2), endpoint=True
+        )
+        nodes = NodesView(np.arange(num_nodes), positions)
+
+        shape = (num_nodes, num_nodes)
+        base = cdist(positions, positions).astype(dtype, copy=False)
+        if jitter is not None:
+            base += jitter(rng, shape)
+            np.maximum(base, 0, out=base)
+        if callable(std_dev):
+            std_dev = np.abs(np.asarray(std_dev(rng, shape), dtype=dtype))
+        else:
+            std_dev = np.full(shape, std_dev, dtype=dtype)
+
+        np.fill_diagonal(base, np.inf)
+        np.fill_diagonal(std_dev, 0)
+        return cls(nodes, base=base, std_dev=std_dev, dtype=dtype, seed=seed)
 
     @classmethod
     def from_dicts(
@@ -43,50 +156,102 @@ class Network:
         data: dict[int, dict[int, tuple[float, float]]],
         coords: dict[int, tuple[float, float]],
         fraction: float = 1,
+        dtype: type = np.float64,
     ):
-        nodes: list[Node] = []
-
-        node_ids: set[NodeID] = set()
-
-        coords_keys = list(coords.keys())
-        if fraction < 1:
-            random.shuffle(coords_keys)
-            num_keys = int(len(coords_keys) * fraction)
-            coords_keys = coords_keys[:num_keys]
-
-        for node_id in coords_keys:
-            nodes.append(Node(node_id, pos=Euclidean2D(*coords[node_id])))
-            node_ids.add(node_id)
-
-        pings = {
-            node1.node_id: {node2.node_id: Ping(float("inf"), 0) for node2 in nodes}
-            for node1 in nodes
-        }
+        node_ids = np.array(list(coords.keys()), dtype=np.int64)
+        positions = np.array(list(coords.values()), dtype=np.float64).reshape(-1, 2)
+        node_index = {node_id: index for index, node_id in enumerate(coords.keys())}
+        base = np.full((len(node_ids), len(node_ids)), np.inf, dtype=dtype)
+        std_dev = np.zeros((len(node_ids), len(node_ids)), dtype=dtype)
 
         for source in data:
-            if source not in node_ids:
+            if source not in node_index:
                 continue
-            pings[source][source] = Ping(0, 0)
+            i = node_index[source]
+            base[i, i] = 0
+            std_dev[i, i] = 0
 
             for destination in data[source]:
-                if destination not in node_ids:
+                if destination not in node_index:
                     continue
 
                 ping_avg, ping_std_dev = data[source][destination]
-                pings[source][destination] = Ping(ping_avg, ping_std_dev)
+                j = node_index[destination]
+                base[i, j] = ping_avg
+                std_dev[i, j] = ping_std_dev
+
+        return cls.from_matrix(node_ids, positions, base, std_dev, fraction, dtype)
+
+    @classmethod
+    def from_matrix(
+        cls,
+        node_ids: np.ndarray,
+        positions: np.ndarray,
+        base: np.ndarray,
+        std_dev: np.ndarray,
+        fraction: float = 1,
+        dtype: type = np.float64,
+    ):
+        """Creates a network from dense latency matrices aligned with [node_ids].
+        With [fraction] < 1, a random subset of nodes is kept by slicing the matrices,
+        so memory-mapped inputs are only read for the selected rows."""
+        indices = list(range(len(node_ids)))
+        if fraction < 1:
+            random.shuffle(indices)
+            indices = indices[: int(len(indices) * fraction)]
+            selection = np.ix_(indices, indices)
+            base = base[selection]
+            std_dev = std_dev[selection]
 
-        return cls(nodes, pings)
+        nodes = NodesView(
+            np.asarray(node_ids, dtype=np.int64)[indices],
+            np.asarray(positions, dtype=np.float64)[indices],
+        )
+        return cls(nodes, base=base, std_dev=std_dev, dtype=dtype)
+
+    @classmethod
+    def from_csv(
+        cls,
+        pings_filename: str,
+        servers_filename: str,
+        fraction: float = 1,
+        cache_dir: str | None = None,
+        dtype: type = np.float64,
+    ):
+        """Creates a network from the pings/servers datasets, going through the
+        binary cache of [load_latency_matrix]"""
+        node_ids, positions, base, std_dev = load_latency_matrix(
+            pings_filename, servers_filename, cache_dir=cache_dir
+        )
+        return cls.from_matrix(node_ids, positions, base, std_dev, fraction, dtype)
 
     def get_base_delay(self, node_1: NodeID, node_2: NodeID) -> float:
         """Returns the latency between two nodes"""
 
-        return self.pings[node_1][node_2].base
+        return self.base[self.node_index[node_1], self.node_index[node_2]]
+
+    def get_base_delays(self, node_id: NodeID) -> np.ndarray:
+        """Returns the latency from a node to every node, aligned with [nodes]"""
+
+        return self.base[self.node_index[node_id]]
 
     def get_delay(self, node_1: NodeID, node_2: NodeID) -> float:
         """Returns the latency between two nodes"""
 
-        ping = self.pings[node_1][node_2]
-        return ping.base + abs(np.random.normal(0, ping.std_dev))
+        i = self.node_index[node_1]
+        j = self.node_index[node_2]
+        return self.base[i, j] + self.std_dev[i, j] * self.jitter.next()
+
+    def get_delays(self, source: NodeID, targets: list[NodeID]) -> np.ndarray:
+        """Returns the latencies from [source] to each of [targets]"""
+
+        i = self.node_index[source]
+        j = [self.node_index[target] for target in targets]
+        return self.base[i, j] + self.std_dev[i, j] * self.jitter.take(len(j))
+
+    def seed(self, seed: int | None) -> None:
+        """Seeds the delay jitter"""
+        self.jitter.seed(seed)
 
     def show_network(self) -> None:
         """Plots the 2D network in a grid"""
@@ -121,35 +286,180 @@ class Network:
         plt.show()
 
 
-def servers_csv_to_dict(filename: str) -> dict[int, tuple[float, float]]:
-    df = pd.read_csv(filename)
-    node_coordinates = df.set_index("id")[["latitude", "longitude"]].T.to_dict()
+class NodesView(Sequence):
+    """Read-only list of Nodes backed by an id array and an N x 2 position array.
+    Node objects are only created when accessed."""
+
+    def __init__(self, node_ids: np.ndarray, positions: np.ndarray):
+        self.node_ids = node_ids
+        self.positions = positions
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        x, y = self.positions[index].tolist()
+        return Node(int(self.node_ids[index]), pos=Euclidean2D(x, y))
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+
+class PingsRow(Mapping):
+    """Dict-like view (NodeID -> Ping) over one row of the latency matrices"""
+
+    def __init__(self, network: Network, index: int):
+        self.network = network
+        self.index = index
+
+    def __getitem__(self, node_id: NodeID) -> Ping:
+        return self.network.get_ping(self.index, self.network.node_index[node_id])
 
-    keys = list(node_coordinates.keys())
-    # random.shuffle(keys)
-    # keys = keys[:int(len(keys)/3)]
+    def __setitem__(self, node_id: NodeID, ping: Ping) -> None:
+        self.network.require_dense("Assigning pings")
+        j = self.network.node_index[node_id]
+        self.network.base[self.index, j] = ping.base
+        self.network.std_dev[self.index, j] = ping.std_dev
 
-    node_coordinates = {
-        k: (
-            float(node_coordinates[k]["latitude"]),
-            float(node_coordinates[k]["longitude"]),
+    def __iter__(self):
+        return iter(self.network.node_index)
+
+    def __len__(self):
+        return len(self.network.node_index)
+
+
+class PingsView(Mapping):
+    """Dict-like view (NodeID -> NodeID -> Ping) over the latency matrices"""
+
+    def __init__(self, network: Network):
+        self.network = network
+
+    def __getitem__(self, node_id: NodeID) -> PingsRow:
+        return PingsRow(self.network, self.network.node_index[node_id])
+
+    def __iter__(self):
+        return iter(self.network.node_index)
+
+    def __len__(self):
+        return len(self.network.node_index)
+
+
+def servers_csv_to_dict(filename: str) -> dict[int, tuple[float, float]]:
+    df = read_servers_csv(filename)
+    return {
+        int(node_id): (float(latitude), float(longitude))
+        for node_id, latitude, longitude in zip(
+            df["id"], df["latitude"], df["longitude"]
         )
-        for k in keys
     }
-    return node_coordinates
 
 
-def pings_csv_to_dict(filename: str) -> dict[str, dict[str, list[str]]]:
+def pings_csv_to_dict(filename: str) -> dict[int, dict[int, tuple[float, float]]]:
+    df = read_pings_csv(filename)
     data = {}
-    with open(filename, "r") as file:
-        next(file)
-        for line in file:
-            parts = [part.strip() for part in line.split(",")]
-            source = int(parts[0].replace('"', ""))
-            destination = int(parts[1].replace('"', ""))
-            ping_avg = float(parts[4].replace('"', ""))
-            ping_std_dev = float(parts[6].replace('"', ""))
-            if source not in data:
-                data[source] = {}
-            data[source][destination] = (ping_avg, ping_std_dev)
+    for source, destination, ping_avg, ping_std_dev in zip(
+        df["source"].tolist(),
+        df["destination"].tolist(),
+        df["avg"].tolist(),
+        df["std_dev"].tolist(),
+    ):
+        if source not in data:
+            data[source] = {}
+        data[source][destination] = (ping_avg, ping_std_dev)
     return data
+
+
+def read_servers_csv(filename: str) -> pd.DataFrame:
+    """Reads the id, latitude and longitude columns of the servers dataset"""
+    return pd.read_csv(filename, usecols=["id", "latitude", "longitude"])
+
+
+def read_pings_csv(filename: str) -> pd.DataFrame:
+    """Reads the pings dataset in bulk into the columns source, destination, avg
+    and std_dev. Only the last measurement of a repeated pair is kept."""
+    df = pd.read_csv(
+        filename,
+        usecols=[0, 1, 4, 6],
+        skipinitialspace=True,
+        dtype={0: np.int64, 1: np.int64, 4: np.float64, 6: np.float64},
+    )
+    df.columns = ["source", "destination", "avg", "std_dev"]
+    return df.drop_duplicates(["source", "destination"], keep="last")
+
+
+CACHE_FILES = ("node_ids", "positions", "base", "std_dev")
+
+
+def _file_signature(filename: str, with_hash: bool) -> dict:
+    """Returns the mtime and size of a file, and optionally its sha256"""
+    stat = os.stat(filename)
+    signature = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    if with_hash:
+        sha256 = hashlib.sha256()
+        with open(filename, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                sha256.update(chunk)
+        signature["sha256"] = sha256.hexdigest()
+    return signature
+
+
+def load_latency_matrix(
+    pings_filename: str,
+    servers_filename: str,
+    cache_dir: str | None = None,
+    verify_hash: bool = False,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Loads the pings/servers datasets as dense matrices.
+
+    The first call parses both CSVs and writes node_ids/positions/base/std_dev as
+    .npy files (plus a meta.json with the sources' signatures) under [cache_dir],
+    which defaults to "<pings_filename>.cache". Later calls memory-map the cached
+    matrices (copy-on-write) as long as the sources' mtime and size, or sha256 if
+    [verify_hash] is set, did not change.
+
+    Returns:
+        tuple: node ids (N), positions (N x 2) as (latitude, longitude), and the
+        base and std_dev latency matrices (N x N), with inf for missing pairs.
+    """
+    if cache_dir is None:
+        cache_dir = pings_filename + ".cache"
+    meta_filename = os.path.join(cache_dir, "meta.json")
+    signature = {
+        "pings": _file_signature(pings_filename, verify_hash),
+        "servers": _file_signature(servers_filename, verify_hash),
+    }
+
+    if os.path.exists(meta_filename):
+        with open(meta_filename, "r") as file:
+            cached_signature = json.load(file)
+        if cached_signature == signature:
+            return tuple(
+                np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="c")
+                for name in CACHE_FILES
+            )
+
+    servers = read_servers_csv(servers_filename)
+    pings = read_pings_csv(pings_filename)
+
+    node_ids = servers["id"].to_numpy(dtype=np.int64)
+    positions = servers[["latitude", "longitude"]].to_numpy(dtype=np.float64)
+    id_index = pd.Index(node_ids)
+    sources = id_index.get_indexer(pings["source"])
+    destinations = id_index.get_indexer(pings["destination"])
+    known = (sources >= 0) & (destinations >= 0)
+
+    base = np.full((len(node_ids), len(node_ids)), np.inf)
+    std_dev = np.zeros((len(node_ids), len(node_ids)))
+    with_data = np.unique(sources[sources >= 0])
+    base[with_data, with_data] = 0
+    base[sources[known], destinations[known]] = pings["avg"].to_numpy()[known]
+    std_dev[sources[known], destinations[known]] = pings["std_dev"].to_numpy()[known]
+    std_dev[~np.isfinite(std_dev)] = 0
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for name, array in zip(CACHE_FILES, (node_ids, positions, base, std_dev)):
+        np.save(os.path.join(cache_dir, f"{name}.npy"), array)
+    # Meta is written last so an interrupted write is never taken as valid
+    with open(meta_filename, "w") as file:
+        json.dump(signature, file)
+
+    return node_ids, positions, base, std_dev
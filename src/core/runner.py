@@ -0,0 +1,128 @@
+""" Parallel Monte Carlo runs """
+
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+import numpy as np
+from core.attacker import Attacker
+from core.instrumentation import Instrumentation, RunProfile
+from core.simulator import Simulator
+from utils.metrics import Metric
+
+# Per-process state, set once by the pool initializer
+_simulator: Simulator | None = None
+_attackers_factory: Callable[[Simulator], list[Attacker]] | None = None
+_run_kwargs: dict = {}
+_instrumentation: Instrumentation | None = None
+
+
+def _init_worker(
+    simulator_factory: Callable[[], Simulator],
+    attackers_factory: Callable[[Simulator], list[Attacker]] | None,
+    run_kwargs: dict,
+    instrument: bool = False,
+    profile_dir: str | None = None,
+) -> None:
+    """Builds the worker's simulator once, so the network is not sent per task"""
+    global _simulator, _attackers_factory, _run_kwargs, _instrumentation
+    _simulator = simulator_factory()
+    _attackers_factory = attackers_factory
+    _run_kwargs = run_kwargs
+    _instrumentation = (
+        Instrumentation(_simulator, profile_dir=profile_dir) if instrument else None
+    )
+
+
+def _run_one(seed: int) -> tuple[Metric, Metric] | tuple[Metric, Metric, RunProfile]:
+    """Executes one seeded run with the worker's simulator"""
+    _simulator.seed(seed)
+    _simulator.setup()
+    attackers = _attackers_factory(_simulator) if _attackers_factory else []
+    if _instrumentation is None:
+        return _simulator.run(attackers=attackers, **_run_kwargs)
+    stretch, attack = _instrumentation.run(attackers, name=f"run-{seed}", **_run_kwargs)
+    return stretch, attack, _instrumentation.last_profile
+
+
+def pool_context() -> multiprocessing.context.BaseContext:
+    """Multiprocessing context of the pools: fork where available, so workers
+    inherit the network instead of unpickling it"""
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def run_seeds(seed: int | None, n_runs: int) -> list[int]:
+    """Derives [n_runs] independent 32-bit seeds from a master seed"""
+    children = np.random.SeedSequence(seed).spawn(n_runs)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+
+def run_many(
+    simulator_factory: Callable[[], Simulator],
+    n_runs: int,
+    workers: int | None = None,
+    seed: int | None = None,
+    attackers_factory: Callable[[Simulator], list[Attacker]] | None = None,
+    instrument: bool = False,
+    profile_dir: str | None = None,
+    **run_kwargs,
+) -> list[tuple[Metric, Metric]]:
+    """Executes [n_runs] independent simulations over a process pool.
+
+    Args:
+        simulator_factory (callable): Builds the Simulator. It is called once per
+            worker; with the fork start method (the default where available) the
+            network it closes over is inherited by the workers instead of pickled.
+        n_runs (int): Number of runs.
+        workers (int | None): Number of processes (defaults to the CPU count).
+            With 1, runs are executed in the current process.
+        seed (int | None): Master seed from which every run's seed is derived, so
+            results do not depend on the number of workers.
+        attackers_factory (callable | None): Builds the attackers of a run, given
+            the simulator after its source was selected.
+        instrument (bool): Run with Instrumentation, appending each run's
+            RunProfile to its result.
+        profile_dir (str | None): With [instrument], directory where every run is
+            also profiled (as run-<seed>.prof).
+        **run_kwargs: Forwarded to Simulator.run.
+
+    Returns:
+        list[tuple[Metric, Metric]]: The (stretch, attacker) metrics of each run,
+        in run order, or (stretch, attacker, RunProfile) with [instrument].
+    """
+    seeds = run_seeds(seed, n_runs)
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        _init_worker(
+            simulator_factory, attackers_factory, run_kwargs, instrument, profile_dir
+        )
+        return [_run_one(run_seed) for run_seed in seeds]
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, n_runs),
+        mp_context=pool_context(),
+        initializer=_init_worker,
+        initargs=(
+            simulator_factory,
+            attackers_factory,
+            run_kwargs,
+            instrument,
+            profile_dir,
+        ),
+    ) as executor:
+        chunksize = max(1, n_runs // (4 * workers))
+        return list(executor.map(_run_one, seeds, chunksize=chunksize))
+
+
+def aggregate_runs(results: list[tuple[Metric, Metric]]) -> tuple[Metric, Metric]:
+    """Concatenates the (stretch, attacker) metrics of several runs"""
+    stretches: list[float] = []
+    attacks: list[bool] = []
+    for stretch, attack in results:
+        stretches += stretch.values
+        attacks += attack.values
+    return Metric(stretches), Metric(attacks)
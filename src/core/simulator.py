@@ -1,17 +1,30 @@
 """ Simulator """
 
-import collections
-from queue import PriorityQueue
 from dataclasses import dataclass
 import random
 from utils.basic_types import Event, Node, NodeID
 from core.clustering import create_cluster_nodes
+from core.event_queue import EventQueue, HeapEventQueue
 from core.gossip_algorithm import GossipAlgorithm
 from utils.metrics import Metric, Metrics
 from core.network import Network
+from core.trace import EventTrace
 import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
 import matplotlib.pyplot as plt
-from core.attacker import Attacker, LowestTimeEstimator
+from core.attacker import Attacker, AttackerEnsemble, LowestTimeEstimator
+
+
+@dataclass
+class RunStats:
+    """Event counters of a run"""
+
+    events_pushed: int = 0
+    events_processed: int = 0
+    events_pruned: int = 0  # Not created, as the target was already saturated
+    events_dropped: int = 0  # Popped after the target got saturated
+    peak_queue_size: int = 0
 
 
 class Simulator:
@@ -27,6 +40,9 @@ class Simulator:
         self.gossip_algorithm = gossip_algorithm
         self.network = network
         self.first_source: Node | None = None
+        self.last_run_stats: RunStats | None = None
+        self.last_trace: EventTrace | None = None
+        self.last_metrics: Metrics | None = None
 
     def setup(self) -> None:
         """Setups the simulator for execution"""
@@ -35,6 +51,13 @@ class Simulator:
             random.randint(0, len(self.network.nodes) - 1)
         ]
 
+    def seed(self, seed: int) -> None:
+        """Seeds every random stream used in a run (source choice, target selection
+        and delay jitter)"""
+        random.seed(seed)
+        np.random.seed(seed)
+        self.network.seed(seed)
+
     def select_targets(self, node_id: NodeID) -> list[NodeID]:
         """Selects a random target for node_id to send a message"""
         return self.gossip_algorithm.select_targets(node_id)
@@ -44,101 +67,241 @@ class Simulator:
         use_max_time: bool = False,
         max_time: float = 0,
         stop_when_all_informed: bool = True,
-        attackers: list[Attacker] = [],
+        attackers: list[Attacker | AttackerEnsemble] = [],
         msg_receival_limit: int = 10,
+        event_queue: type[EventQueue] = HeapEventQueue,
+        record_trace: bool = False,
+        trace_path: str | None = None,
     ) -> tuple[Metric, Metric]:
         """Executes the simulation by:
         - Choosing a random source
         - Iterating over the network events until max time or all are informed
+
+        Events are never created for targets that already received more than
+        [msg_receival_limit] messages, as they would be dropped when popped, and the
+        loop ends once every node is saturated. The event counters are kept in
+        [last_run_stats], and the run's Metrics (arrival times, receipt counts,
+        coverage, duplicates) in [last_metrics].
+
+        Individual attackers observe events as they are processed, while each
+        AttackerEnsemble receives the log of processed events after the loop.
+        With [record_trace] (or a [trace_path] to save it to), that log is also
+        kept as an EventTrace in [last_trace], to replay it to other attackers.
         """
 
         current_time: float = 0
-        current_id: int = 0
 
         # Create queue
-        queue: PriorityQueue = PriorityQueue()
+        queue: EventQueue = event_queue()
 
-        # Counter of the number of times a node received a message
-        node_receipt_counter: dict[NodeID, int] = collections.defaultdict(int)
+        # Attackers evaluated per event, and ensembles evaluated on the event log
+        all_attackers = attackers
+        ensembles = [a for a in attackers if isinstance(a, AttackerEnsemble)]
+        attackers = [a for a in attackers if not isinstance(a, AttackerEnsemble)]
+        log_sources: list[NodeID] = []
+        log_targets: list[NodeID] = []
+        log_timestamps: list[float] = []
+        record_log = bool(ensembles) or record_trace or trace_path is not None
 
-        def add_event(queue: PriorityQueue, event: Event) -> PriorityQueue:
-            queue.put((event.timestamp, event.id, event))
-            return queue
+        # Counter of the number of times a node received a message, aligned with
+        # the network's node index
+        node_index = self.network.node_index
+        num_nodes = len(self.network.nodes)
+        node_receipt_counter: list[int] = [0] * num_nodes
 
         # Create initial event
-        targets = self.select_targets(self.first_source.node_id)
-        node_receipt_counter[self.first_source.node_id] += 1
-        for target in targets:
-            initial_event = Event(
-                source=self.first_source.node_id,
-                target=target,
-                timestamp=current_time
-                + self.network.get_delay(self.first_source.node_id, target),
-                id=current_id,
-            )
-            current_id += 1
-            add_event(queue, initial_event)
+        first_source_id = self.first_source.node_id
+        targets = self.select_targets(first_source_id)
+        node_receipt_counter[node_index[first_source_id]] += 1
+        delays = self.network.get_delays(first_source_id, targets)
+        queue.push_many((current_time + delays).tolist(), first_source_id, targets)
+        stats = RunStats(events_pushed=len(targets), peak_queue_size=len(queue))
+
+        # Number of nodes that won't process any more events
+        num_saturated = 1 if msg_receival_limit < 1 else 0
 
         # Metrics
-        arrival_time: dict[NodeID, float] = (
-            {}
-        )  # NodeID and the time it first received the message
-        arrival_time[self.first_source.node_id] = 0
+        arrival_time: list[float] = [
+            float("nan")
+        ] * num_nodes  # Time each node first received the message (by node index)
+        arrival_time[node_index[first_source_id]] = 0
+        num_informed = 1
 
         # Iterate
-        while not queue.empty():
+        while len(queue) > 0:
             if use_max_time and current_time > max_time:
                 break
-            if stop_when_all_informed and len(arrival_time) == len(self.network.nodes):
+            if stop_when_all_informed and num_informed == num_nodes:
+                break
+            if num_saturated == num_nodes:
+                stats.events_dropped += len(queue)
                 break
 
             # Get next event
-            event: Event | None = None
-            event_time, _, event = queue.get()
+            event_time, event_id, source, target = queue.pop()
 
             # Check if node is still processing events
-            if node_receipt_counter[event.target] > msg_receival_limit:
+            target_index = node_index[target]
+            receipts = node_receipt_counter[target_index]
+            if receipts > msg_receival_limit:
+                stats.events_dropped += 1
                 continue
-            node_receipt_counter[event.target] += 1
-
-            # print("Processing event:", event)
+            node_receipt_counter[target_index] = receipts + 1
+            if receipts == msg_receival_limit:
+                num_saturated += 1
+            stats.events_processed += 1
 
             # Send event to attackers
-            for attacker in attackers:
-                if attacker.has_access_to_event(event):
-                    attacker.process_event(event)
+            if attackers:
+                event = Event(
+                    source=source, target=target, timestamp=event_time, id=event_id
+                )
+                for attacker in attackers:
+                    if attacker.has_access_to_event(event):
+                        attacker.process_event(event)
+            if record_log:
+                log_sources.append(source)
+                log_targets.append(target)
+                log_timestamps.append(event_time)
 
             # Add target to active, if not yet active
-            if event.target not in arrival_time:
-                arrival_time[event.target] = event.timestamp
+            if receipts == 0:
+                arrival_time[target_index] = event_time
+                num_informed += 1
 
             # Process message
-            new_source = event.target
-            targets = self.select_targets(new_source)
-            for target in targets:
-                queue = add_event(
-                    queue,
-                    Event(
-                        source=new_source,
-                        target=target,
-                        timestamp=event.timestamp
-                        + self.network.get_delay(new_source, target),
-                        id=current_id,
-                    ),
-                )
-                current_id += 1
+            targets = self.select_targets(target)
+            open_targets = [
+                new_target
+                for new_target in targets
+                if node_receipt_counter[node_index[new_target]] <= msg_receival_limit
+            ]
+            stats.events_pruned += len(targets) - len(open_targets)
+            if open_targets:
+                delays = self.network.get_delays(target, open_targets)
+                queue.push_many((event_time + delays).tolist(), target, open_targets)
+                stats.events_pushed += len(open_targets)
+                if len(queue) > stats.peak_queue_size:
+                    stats.peak_queue_size = len(queue)
 
             # Update current time
             current_time = event_time
 
+        self.last_run_stats = stats
+        if record_trace or trace_path is not None:
+            self.last_trace = EventTrace.from_lists(
+                first_source_id, log_sources, log_targets, log_timestamps
+            )
+            if trace_path is not None:
+                self.last_trace.save(trace_path)
+
         # Runs attackers
         attacker_results = []
-        for attacker in attackers:
-            guess = attacker.guess()
-            attacker_results.append(guess == self.first_source.node_id)
+        for attacker in all_attackers:
+            if isinstance(attacker, AttackerEnsemble):
+                attacker.process_event_log(log_sources, log_targets, log_timestamps)
+                attacker_results += [
+                    guess == first_source_id for guess in attacker.guess()
+                ]
+            else:
+                attacker_results.append(attacker.guess() == first_source_id)
 
         # Compute stretch
-        metrics = Metrics(self.network, self.first_source, arrival_time)
+        metrics = Metrics(
+            self.network,
+            self.first_source,
+            np.array(arrival_time),
+            receipt_counts=np.array(node_receipt_counter),
+            messages_sent=stats.events_pushed + stats.events_pruned,
+        )
+        self.last_metrics = metrics
         stretch = metrics.get_stretch()
 
         return stretch, Metric(attacker_results)
+
+    def sample_forwarding_graph(
+        self, rng: np.random.Generator, forwards_per_node: int = 1
+    ) -> csr_matrix:
+        """Samples, for every node, the targets of its [forwards_per_node] forwards
+        (GossipAlgorithm.batch_select_targets) and their delays, as a sparse
+        weighted graph over node indices. Self-loops and missing pairs are left
+        out, and repeated edges keep their smallest delay."""
+        num_nodes = len(self.network.nodes)
+        senders = np.repeat(np.arange(num_nodes), forwards_per_node)
+        rows, targets = self.gossip_algorithm.batch_select_targets(senders, rng)
+        senders = senders[rows]
+        delays = self.network.base[senders, targets] + self.network.std_dev[
+            senders, targets
+        ] * np.abs(rng.standard_normal(len(senders)))
+
+        keep = np.isfinite(delays) & (senders != targets)
+        senders, targets, delays = senders[keep], targets[keep], delays[keep]
+        order = np.lexsort((delays, targets, senders))
+        senders, targets, delays = senders[order], targets[order], delays[order]
+        first = np.ones(len(senders), dtype=bool)
+        first[1:] = (senders[1:] != senders[:-1]) | (targets[1:] != targets[:-1])
+        return csr_matrix(
+            (delays[first], (senders[first], targets[first])),
+            shape=(num_nodes, num_nodes),
+        )
+
+    def run_shortest_paths(
+        self,
+        sources: list[NodeID] | None = None,
+        n_runs: int = 1,
+        seed: int | None = None,
+        forwards_per_node: int = 1,
+        resample_per_source: bool = False,
+    ) -> list[Metric]:
+        """Computes first-arrival times as shortest paths (scipy's dijkstra) over a
+        pre-sampled forwarding graph, instead of running the event loop. Only
+        protocols implementing GossipAlgorithm.batch_select_targets are supported.
+
+        This is exact (in distribution) for run(msg_receival_limit=0): every node
+        forwards once, on its first receipt, to targets that do not depend on the
+        message history, so arrival times are shortest paths over the graph of
+        those forwards. With [forwards_per_node] = L + 1 it gives a lower bound
+        for msg_receival_limit=L, since all forwards are assumed to leave at the
+        first arrival. Missing pairs are treated as absent edges, so nodes only
+        reachable through them are left out of the stretch.
+
+        By default one graph is sampled and shared by every source (one
+        multi-source dijkstra call), so runs are not independent of each other;
+        [resample_per_source] samples a new graph per source.
+
+        Returns:
+            list[Metric]: The stretch of each source, as returned by run.
+        """
+        self.network.require_dense("Simulator.run_shortest_paths")
+        rng = np.random.default_rng(seed)
+        num_nodes = len(self.network.nodes)
+        if sources is None:
+            source_indices = rng.integers(0, num_nodes, size=n_runs)
+        else:
+            source_indices = np.array(
+                [self.network.node_index[source] for source in sources],
+                dtype=np.int64,
+            )
+
+        if resample_per_source:
+            arrival_times = np.vstack(
+                [
+                    dijkstra(
+                        self.sample_forwarding_graph(rng, forwards_per_node),
+                        indices=[source],
+                    )
+                    for source in source_indices
+                ]
+            )
+        else:
+            graph = self.sample_forwarding_graph(rng, forwards_per_node)
+            arrival_times = dijkstra(graph, indices=source_indices)
+
+        stretches: list[Metric] = []
+        for source, arrival in zip(source_indices, arrival_times):
+            reached = np.isfinite(arrival)
+            reached[source] = False
+            stretches.append(
+                Metric((arrival[reached] / self.network.base[source, reached]).tolist())
+            )
+        return stretches
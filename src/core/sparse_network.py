@@ -0,0 +1,390 @@
+""" Sparse latency network """
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from sklearn.neighbors import BallTree
+from core.network import Network, NodesView, read_pings_csv, read_servers_csv
+from utils.basic_types import NodeID, Ping
+from utils.cache import LRUCache
+from utils.probability import HalfNormalSampler
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def great_circle_distances(
+    positions_1: np.ndarray, positions_2: np.ndarray
+) -> np.ndarray:
+    """Pairwise (element-wise, with broadcasting) haversine distances in km between
+    (latitude, longitude) positions in degrees"""
+    lat_1, lon_1 = np.radians(positions_1[..., 0]), np.radians(positions_1[..., 1])
+    lat_2, lon_2 = np.radians(positions_2[..., 0]), np.radians(positions_2[..., 1])
+    a = (
+        np.sin((lat_2 - lat_1) / 2) ** 2
+        + np.cos(lat_1) * np.cos(lat_2) * np.sin((lon_2 - lon_1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+@dataclass
+class DistanceLatencyModel:
+    """Latency estimate for unmeasured pairs: linear in the great-circle distance
+    plus a per-node offset (e.g. access link delay) of both ends,
+        base(i, j) = intercept + slope * distance(i, j) + offsets[i] + offsets[j]
+    with a std_dev proportional to the base latency."""
+
+    intercept: float
+    slope: float  # Latency per km
+    offsets: np.ndarray  # Per node, aligned with network.nodes
+    std_dev_ratio: float = 0.0
+
+    def predict(
+        self, positions: np.ndarray, sources: np.ndarray, targets: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Base latencies and std_devs between node indices sources[i], targets[i]"""
+        distances = great_circle_distances(positions[sources], positions[targets])
+        base = np.maximum(
+            self.intercept
+            + self.slope * distances
+            + self.offsets[sources]
+            + self.offsets[targets],
+            0,
+        )
+        return base, base * self.std_dev_ratio
+
+    @classmethod
+    def fit(
+        cls,
+        positions: np.ndarray,
+        sources: np.ndarray,
+        targets: np.ndarray,
+        base: np.ndarray,
+        std_dev: np.ndarray | None = None,
+        iterations: int = 5,
+    ) -> "DistanceLatencyModel":
+        """Least-squares fit on the measured pairs (sources[i], targets[i]) with
+        latency base[i], alternating between the linear term and the offsets.
+        Nodes without measurements get no offset."""
+        num_nodes = len(positions)
+        distances = great_circle_distances(positions[sources], positions[targets])
+        design = np.stack([np.ones_like(distances), distances], axis=1)
+        degree = np.bincount(sources, minlength=num_nodes) + np.bincount(
+            targets, minlength=num_nodes
+        )
+        offsets = np.zeros(num_nodes)
+        intercept = slope = 0.0
+        for _ in range(iterations):
+            target_base = base - offsets[sources] - offsets[targets]
+            (intercept, slope), *_ = np.linalg.lstsq(design, target_base, rcond=None)
+            # Each node's offset is its mean residual, given the other ends' offsets
+            residuals = base - intercept - slope * distances
+            sums = np.bincount(
+                sources, weights=residuals - offsets[targets], minlength=num_nodes
+            ) + np.bincount(
+                targets, weights=residuals - offsets[sources], minlength=num_nodes
+            )
+            offsets = np.divide(sums, degree, out=np.zeros(num_nodes), where=degree > 0)
+
+        std_dev_ratio = 0.0
+        if std_dev is not None:
+            positive = base > 0
+            if positive.any():
+                std_dev_ratio = float(np.median(std_dev[positive] / base[positive]))
+        return cls(float(intercept), float(slope), offsets, std_dev_ratio)
+
+
+class SparseNetwork(Network):
+    """Network for topologies too large for dense N x N latency matrices.
+
+    Only measured pings are stored, as CSR matrices over node indices
+    (`measured_base` and `measured_std_dev`, directed, sharing one sparsity
+    pattern). Every other pair is estimated on demand by a DistanceLatencyModel,
+    fitted on the measured pairs unless one is given, and a node reaches itself
+    with no delay. Single-pair lookups and full rows are served from small LRU
+    caches.
+
+    get_delay, get_delays, get_base_delay and get_base_delays (and so Simulator.run
+    and Metrics) work as on a dense Network, and `pings` is a read-only view of the
+    same latencies. Code that reads the dense `base` and `std_dev` matrices
+    directly (BatchSimulator, Simulator.run_shortest_paths, SpatialGossip) raises
+    TypeError when given a SparseNetwork.
+    """
+
+    dense: bool = False
+
+    def __init__(
+        self,
+        nodes: NodesView,
+        sources: np.ndarray,
+        targets: np.ndarray,
+        base: np.ndarray,
+        std_dev: np.ndarray | None = None,
+        model: DistanceLatencyModel | None = None,
+        cache_size: int = 4096,
+        seed: int | None = None,
+    ):
+        """Builds the network from measured pings: base[i] (and std_dev[i]) is the
+        latency from node index sources[i] to node index targets[i]. Self pairs and
+        non-finite measurements are ignored, and of a repeated pair only the last
+        measurement is kept."""
+        # The dense matrices of Network are never built
+        num_nodes = len(nodes)
+        self.nodes = nodes
+        self.positions = np.asarray(nodes.positions, dtype=np.float64)
+        self.node_index: dict[NodeID, int] = {
+            node_id: index for index, node_id in enumerate(nodes.node_ids.tolist())
+        }
+        self.jitter = HalfNormalSampler(seed)
+        self._fingerprint: str | None = None
+
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        base = np.asarray(base, dtype=np.float64)
+        std_dev = (
+            np.zeros_like(base)
+            if std_dev is None
+            else np.nan_to_num(np.asarray(std_dev, dtype=np.float64))
+        )
+        keep = (sources != targets) & np.isfinite(base)
+        sources, targets, base, std_dev = (
+            sources[keep],
+            targets[keep],
+            base[keep],
+            std_dev[keep],
+        )
+        order = np.lexsort((targets, sources))
+        sources, targets = sources[order], targets[order]
+        base, std_dev = base[order], std_dev[order]
+        # The sort is stable, so the last entry of a repeated pair is the last given
+        last = np.ones(len(sources), dtype=bool)
+        last[:-1] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        sources, targets = sources[last], targets[last]
+        base, std_dev = base[last], std_dev[last]
+
+        indptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(sources, minlength=num_nodes))]
+        )
+        shape = (num_nodes, num_nodes)
+        self.measured_base = csr_matrix((base, targets, indptr), shape=shape)
+        self.measured_std_dev = csr_matrix((std_dev, targets, indptr), shape=shape)
+
+        if model is None:
+            model = DistanceLatencyModel.fit(
+                self.positions, sources, targets, base, std_dev
+            )
+        self.model = model
+
+        # Row bounds as a list, and coordinates in radians, for per-event lookups
+        self._indptr: list[int] = indptr.tolist()
+        self._latitudes = np.radians(self.positions[:, 0])
+        self._longitudes = np.radians(self.positions[:, 1])
+        self._cos_latitudes = np.cos(self._latitudes)
+        self.pair_cache = LRUCache(cache_size)
+        self.row_cache = LRUCache(8)
+
+    @classmethod
+    def from_network(cls, network: Network, k: int, **kwargs) -> "SparseNetwork":
+        """Keeps, for every node of a dense network, the pings to its [k] nearest
+        (great-circle) measured peers"""
+        sources, targets = np.nonzero(np.isfinite(network.base))
+        nodes = NodesView(
+            np.array(list(network.node_index), dtype=np.int64), network.positions
+        )
+        sources, targets = nearest_pairs(network.positions, sources, targets, k)
+        return cls(
+            nodes,
+            sources,
+            targets,
+            network.base[sources, targets],
+            network.std_dev[sources, targets],
+            **kwargs,
+        )
+
+    @classmethod
+    def from_csv(
+        cls,
+        pings_filename: str,
+        servers_filename: str,
+        k: int | None = None,
+        **kwargs,
+    ) -> "SparseNetwork":
+        """Creates a network from the pings/servers datasets without building the
+        dense matrices, keeping every measured pair or, with [k], the pings to each
+        node's [k] nearest measured peers"""
+        servers = read_servers_csv(servers_filename)
+        pings = read_pings_csv(pings_filename)
+        node_ids = servers["id"].to_numpy(dtype=np.int64)
+        positions = servers[["latitude", "longitude"]].to_numpy(dtype=np.float64)
+        id_index = pd.Index(node_ids)
+        sources = id_index.get_indexer(pings["source"])
+        targets = id_index.get_indexer(pings["destination"])
+        known = (sources >= 0) & (targets >= 0)
+        base = pings["avg"].to_numpy()[known]
+        std_dev = pings["std_dev"].to_numpy()[known]
+        sources, targets = sources[known], targets[known]
+        if k is not None:
+            selected = nearest_pairs(positions, sources, targets, k, return_mask=True)
+            sources, targets = sources[selected], targets[selected]
+            base, std_dev = base[selected], std_dev[selected]
+        return cls(
+            NodesView(node_ids, positions), sources, targets, base, std_dev, **kwargs
+        )
+
+    @classmethod
+    def randomize(
+        cls,
+        num_nodes: int,
+        k: int = 16,
+        seed: int | None = None,
+        model: DistanceLatencyModel | None = None,
+        noise: float = 0.1,
+        std_dev_ratio: float = 0.05,
+        **kwargs,
+    ) -> "SparseNetwork":
+        """Creates a network of nodes placed uniformly on the globe, with pings to
+        each node's [k] nearest peers drawn from [model] (by default 5 ms plus
+        0.01 ms/km plus exponential per-node offsets of mean 2 ms) with log-normal
+        [noise]. The network's own model is fitted on those pings."""
+        rng = np.random.default_rng(seed)
+        latitudes = np.degrees(np.arcsin(rng.uniform(-1, 1, num_nodes)))
+        longitudes = rng.uniform(-180, 180, num_nodes)
+        positions = np.stack([latitudes, longitudes], axis=1)
+        if model is None:
+            model = DistanceLatencyModel(
+                5.0, 0.01, rng.exponential(2.0, num_nodes), std_dev_ratio
+            )
+
+        tree = BallTree(np.radians(positions), metric="haversine")
+        k = min(k, num_nodes - 1)
+        _, neighbors = tree.query(np.radians(positions), k=k + 1)
+        sources = np.repeat(np.arange(num_nodes), k)
+        targets = neighbors[:, 1:].ravel()
+        base, std_dev = model.predict(positions, sources, targets)
+        base = base * rng.lognormal(0, noise, len(base))
+        nodes = NodesView(np.arange(num_nodes), positions)
+        return cls(nodes, sources, targets, base, std_dev, seed=seed, **kwargs)
+
+    def get_ping(self, i: int, j: int) -> Ping:
+        return Ping(*self.lookup_pair(i, j))
+
+    def measured_pairs(self) -> tuple[np.ndarray, np.ndarray]:
+        """Node indices (sources, targets) of the measured pairs"""
+        indptr = self.measured_base.indptr
+        sources = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        return sources, self.measured_base.indices
+
+    def estimate(
+        self, source_index: int, target_indices: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Model latencies (base, std_dev) from a node index to several node
+        indices, using the precomputed coordinates in radians"""
+        latitudes, longitudes = self._latitudes, self._longitudes
+        cos_latitudes = self._cos_latitudes
+        half_dlat = (latitudes[target_indices] - latitudes[source_index]) * 0.5
+        half_dlon = (longitudes[target_indices] - longitudes[source_index]) * 0.5
+        a = (
+            np.sin(half_dlat) ** 2
+            + cos_latitudes[source_index]
+            * cos_latitudes[target_indices]
+            * np.sin(half_dlon) ** 2
+        )
+        distances = np.arcsin(np.sqrt(np.minimum(a, 1))) * (2 * EARTH_RADIUS_KM)
+        model = self.model
+        base = distances * model.slope
+        base += model.intercept + model.offsets[source_index]
+        base += model.offsets[target_indices]
+        np.maximum(base, 0, out=base)
+        return base, base * model.std_dev_ratio
+
+    def lookup(
+        self, source_index: int, target_indices: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Base latencies and std_devs from a node index to several node indices:
+        measured where available, estimated by the model otherwise"""
+        base, std_dev = self.estimate(source_index, target_indices)
+        start = self._indptr[source_index]
+        end = self._indptr[source_index + 1]
+        if start < end:
+            columns = self.measured_base.indices[start:end]
+            positions = columns.searchsorted(target_indices)
+            np.minimum(positions, end - start - 1, out=positions)
+            found = columns[positions] == target_indices
+            if found.any():
+                positions = positions[found] + start
+                base[found] = self.measured_base.data[positions]
+                std_dev[found] = self.measured_std_dev.data[positions]
+        self_pairs = target_indices == source_index
+        if self_pairs.any():
+            base[self_pairs] = 0
+            std_dev[self_pairs] = 0
+        return base, std_dev
+
+    def lookup_pair(self, i: int, j: int) -> tuple[float, float]:
+        """(base, std_dev) between two node indices, through the pair cache"""
+        ping = self.pair_cache.get((i, j))
+        if ping is None:
+            base, std_dev = self.lookup(i, np.array([j]))
+            ping = (float(base[0]), float(std_dev[0]))
+            self.pair_cache.put((i, j), ping)
+        return ping
+
+    def get_base_delay(self, node_1: NodeID, node_2: NodeID) -> float:
+        """Returns the latency between two nodes"""
+
+        return self.lookup_pair(self.node_index[node_1], self.node_index[node_2])[0]
+
+    def get_base_delays(self, node_id: NodeID) -> np.ndarray:
+        """Returns the latency from a node to every node, aligned with [nodes]"""
+
+        i = self.node_index[node_id]
+        row = self.row_cache.get(i)
+        if row is None:
+            row, _ = self.lookup(i, np.arange(len(self.nodes)))
+            row.flags.writeable = False
+            self.row_cache.put(i, row)
+        return row
+
+    def get_delay(self, node_1: NodeID, node_2: NodeID) -> float:
+        """Returns the latency between two nodes"""
+
+        base, std_dev = self.lookup_pair(
+            self.node_index[node_1], self.node_index[node_2]
+        )
+        return base + std_dev * self.jitter.next()
+
+    def get_delays(self, source: NodeID, targets: list[NodeID]) -> np.ndarray:
+        """Returns the latencies from [source] to each of [targets]"""
+
+        node_index = self.node_index
+        j = np.fromiter(
+            (node_index[target] for target in targets),
+            dtype=np.int64,
+            count=len(targets),
+        )
+        base, std_dev = self.lookup(node_index[source], j)
+        return base + std_dev * self.jitter.take(len(j))
+
+
+def nearest_pairs(
+    positions: np.ndarray,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    k: int,
+    return_mask: bool = False,
+) -> tuple[np.ndarray, np.ndarray] | np.ndarray:
+    """Selects, among the pairs (sources[i], targets[i]), each source's [k] nearest
+    targets by great-circle distance (self pairs excluded). Returns the selected
+    pairs, or with [return_mask] a boolean mask over the input pairs."""
+    distances = great_circle_distances(positions[sources], positions[targets])
+    distances[sources == targets] = np.inf
+    order = np.lexsort((distances, sources))
+    sorted_sources = sources[order]
+    starts = np.searchsorted(sorted_sources, sorted_sources, side="left")
+    rank = np.arange(len(order)) - starts
+    selected = np.zeros(len(sources), dtype=bool)
+    selected[order[(rank < k) & np.isfinite(distances[order])]] = True
+    if return_mask:
+        return selected
+    return sources[selected], targets[selected]
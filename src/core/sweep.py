@@ -0,0 +1,307 @@
+""" Parameter sweeps with a resumable on-disk result store """
+
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+import hashlib
+import itertools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from core.attacker import Attacker, create_random_attackers
+from core.gossip_algorithm import GossipAlgorithm
+from core.instrumentation import Instrumentation, RunProfile
+from core.network import Network
+from core.runner import pool_context, run_seeds
+from core.simulator import Simulator
+from utils.basic_types import NodeID
+from utils.metrics import Metric
+
+
+@dataclass
+class AttackerConfig:
+    """Attackers created for every run of a grid point"""
+
+    cls: type[Attacker]
+    fraction_curious_nodes: float
+    num_attackers: int = 1
+
+    def to_dict(self) -> dict:
+        """JSON-friendly representation"""
+        return {**asdict(self), "cls": self.cls.__name__}
+
+
+def param_grid(**params: list) -> list[dict]:
+    """Returns the cartesian product of the given parameter values, e.g.
+    param_grid(fanout=[5, 6]) == [{"fanout": 5}, {"fanout": 6}]"""
+    names = list(params.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*params.values())]
+
+
+class ResultStore:
+    """Append-only Parquet store. Every completed grid point is written as its own
+    part file (part-<key>.parquet) in a directory, so an interrupted sweep leaves
+    every finished point readable and a restart can skip them."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def part_filename(self, key: str) -> str:
+        """Path of the part file of a grid point"""
+        return os.path.join(self.path, f"part-{key}.parquet")
+
+    def completed_keys(self) -> set[str]:
+        """Keys of the grid points already stored"""
+        return {
+            filename[len("part-") : -len(".parquet")]
+            for filename in os.listdir(self.path)
+            if filename.startswith("part-") and filename.endswith(".parquet")
+        }
+
+    def append(self, key: str, rows: dict[str, list]) -> None:
+        """Writes the rows of a grid point. The file is renamed into place only once
+        fully written."""
+        filename = self.part_filename(key)
+        pq.write_table(pa.table(rows), filename + ".tmp")
+        os.replace(filename + ".tmp", filename)
+
+    def load(self) -> pd.DataFrame:
+        """Reads every stored row"""
+        filenames = sorted(self.part_filename(key) for key in self.completed_keys())
+        if not filenames:
+            return pd.DataFrame()
+        return pd.concat(
+            [pq.read_table(filename).to_pandas() for filename in filenames],
+            ignore_index=True,
+        )
+
+
+def point_key(description: dict) -> str:
+    """Stable identifier of a grid point"""
+    encoded = json.dumps(description, sort_keys=True, default=str)
+    return hashlib.sha1(encoded.encode()).hexdigest()[:16]
+
+
+# Per-process state of the sweep workers, set once by the pool initializer
+_network: Network | None = None
+_node_ids: list[NodeID] = []
+_algorithm_cls: type[GossipAlgorithm] | None = None
+_run_kwargs: dict = {}
+_instrument: bool = False
+_profile_dir: str | None = None
+# Simulator (and Instrumentation) of the grid point run last by this worker
+_point: tuple[str, Simulator, Instrumentation | None] | None = None
+
+
+def _init_sweep_worker(
+    network: Network,
+    algorithm_cls: type[GossipAlgorithm],
+    run_kwargs: dict,
+    instrument: bool = False,
+    profile_dir: str | None = None,
+) -> None:
+    """Stores the sweep's shared arguments, so they are not sent per task"""
+    global _network, _node_ids, _algorithm_cls, _run_kwargs, _instrument
+    global _profile_dir, _point
+    _network = network
+    _node_ids = [node.node_id for node in network.nodes]
+    _algorithm_cls = algorithm_cls
+    _run_kwargs = run_kwargs
+    _instrument = instrument
+    _profile_dir = profile_dir
+    _point = None
+
+
+def _run_point_seed(
+    task: tuple[str, dict, list[AttackerConfig], int],
+) -> tuple[Metric, Metric] | tuple[Metric, Metric, RunProfile]:
+    """Executes one seeded run of a grid point. The point's simulator is built by
+    its first task on each worker and reused by the following ones."""
+    global _point
+    key, params, attackers, seed = task
+    if _point is None or _point[0] != key:
+        simulator = Simulator(_network, _algorithm_cls(_network, **params))
+        instrumentation = None
+        if _instrument:
+            instrumentation = Instrumentation(
+                simulator,
+                profile_dir=(
+                    None if _profile_dir is None else os.path.join(_profile_dir, key)
+                ),
+            )
+        _point = (key, simulator, instrumentation)
+    _, simulator, instrumentation = _point
+
+    simulator.seed(seed)
+    simulator.setup()
+    run_attackers: list[Attacker] = []
+    for config in attackers:
+        run_attackers += create_random_attackers(
+            config.cls,
+            _node_ids,
+            simulator.first_source.node_id,
+            config.fraction_curious_nodes,
+            num_attackers=config.num_attackers,
+        )
+    if instrumentation is None:
+        return simulator.run(attackers=run_attackers, **_run_kwargs)
+    stretch, attack = instrumentation.run(
+        run_attackers, name=f"run-{seed}", **_run_kwargs
+    )
+    return stretch, attack, instrumentation.last_profile
+
+
+def run_sweep(
+    network: Network,
+    algorithm_cls: type[GossipAlgorithm],
+    algorithm_grid: list[dict],
+    store: ResultStore,
+    n_runs: int,
+    attacker_configs: list[list[AttackerConfig]] = [[]],
+    seed: int = 0,
+    workers: int | None = None,
+    instrument: bool = False,
+    profile_dir: str | None = None,
+    **run_kwargs,
+) -> pd.DataFrame:
+    """Runs [n_runs] simulations for every combination of [algorithm_grid] (keyword
+    arguments of [algorithm_cls] besides the network) and [attacker_configs].
+
+    The runs of every pending grid point are executed as (point, seed) tasks over
+    one process pool for the whole sweep (seeded as run_many would). Each grid
+    point is appended to [store] as soon as its runs complete, and points already
+    in the store are skipped, so an interrupted sweep resumes where it stopped.
+
+    With [instrument], every run is timed with Instrumentation and its RunProfile
+    is stored with it (see summarize_profiles); with a [profile_dir], every run is
+    also profiled under <profile_dir>/<point key>/.
+
+    Returns:
+        pd.DataFrame: Every row of the store, one per run, with the grid point's
+        parameters (param_<name>), the attackers, the per-run stretch summary and
+        accuracy, and the raw stretch/attack values.
+    """
+    completed = store.completed_keys()
+
+    points: list[tuple[str, dict, dict]] = []
+    tasks: list[tuple[str, dict, list[AttackerConfig], int]] = []
+    for params, attackers in itertools.product(algorithm_grid, attacker_configs):
+        description = {
+            "algorithm": algorithm_cls.__name__,
+            "params": params,
+            "attackers": [config.to_dict() for config in attackers],
+            "n_runs": n_runs,
+            "seed": seed,
+            "run_kwargs": run_kwargs,
+        }
+        if instrument:
+            description["instrument"] = True
+        key = point_key(description)
+        if key in completed:
+            continue
+
+        point_seed = int(
+            np.random.SeedSequence([seed, int(key[:8], 16)]).generate_state(1)[0]
+        )
+        points.append((key, params, description))
+        tasks += [
+            (key, params, attackers, run_seed)
+            for run_seed in run_seeds(point_seed, n_runs)
+        ]
+
+    if not tasks:
+        return store.load()
+
+    initargs = (network, algorithm_cls, run_kwargs, instrument, profile_dir)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_sweep_worker(*initargs)
+        store_points(store, algorithm_cls, points, n_runs, map(_run_point_seed, tasks))
+        return store.load()
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(tasks)),
+        mp_context=pool_context(),
+        initializer=_init_sweep_worker,
+        initargs=initargs,
+    ) as executor:
+        # Tasks are in point order, so each chunk mostly reuses one simulator
+        chunksize = max(1, min(n_runs, len(tasks) // (4 * workers)))
+        results = executor.map(_run_point_seed, tasks, chunksize=chunksize)
+        store_points(store, algorithm_cls, points, n_runs, results)
+    return store.load()
+
+
+def store_points(
+    store: ResultStore,
+    algorithm_cls: type[GossipAlgorithm],
+    points: list[tuple[str, dict, dict]],
+    n_runs: int,
+    results: Iterator[tuple],
+) -> None:
+    """Appends each (key, params, description) point to [store] as soon as its
+    [n_runs] results (in task order) are available"""
+    for key, params, description in points:
+        point_results = list(itertools.islice(results, n_runs))
+        profiles = [result[2] for result in point_results if len(result) > 2]
+        point_results = [result[:2] for result in point_results]
+
+        rows: dict[str, list] = {
+            "key": [key] * n_runs,
+            "algorithm": [algorithm_cls.__name__] * n_runs,
+            "attackers": [json.dumps(description["attackers"])] * n_runs,
+        }
+        for name, value in params.items():
+            rows[f"param_{name}"] = [value] * n_runs
+        rows["run"] = list(range(n_runs))
+        rows["stretch_mean"] = [float(stretch.mean()) for stretch, _ in point_results]
+        rows["stretch_std"] = [
+            float(np.std(stretch.values)) for stretch, _ in point_results
+        ]
+        rows["accuracy"] = [
+            float(np.mean(attack.values)) if attack.values else float("nan")
+            for _, attack in point_results
+        ]
+        rows["stretch"] = [
+            [float(v) for v in stretch.values] for stretch, _ in point_results
+        ]
+        rows["attacks"] = [
+            [bool(v) for v in attack.values] for _, attack in point_results
+        ]
+        for profile in profiles:
+            for name, value in profile.to_dict().items():
+                if name != "runs":
+                    rows.setdefault(name, []).append(value)
+        store.append(key, rows)
+
+
+def summarize_profiles(results: pd.DataFrame) -> pd.DataFrame:
+    """Aggregates the run profiles of an instrumented sweep per grid point (algorithm,
+    parameters and attackers), most expensive first. Results without run profiles
+    (not instrumented) give an empty summary."""
+    if "wall_time" not in results.columns:
+        return pd.DataFrame()
+    point = ["algorithm", "attackers"] + [
+        column for column in results.columns if column.startswith("param_")
+    ]
+    profiled = results.dropna(subset=["wall_time"])
+    timings = [
+        column
+        for column in profiled.columns
+        if column.startswith(("time_", "calls_", "events_"))
+        and column != "events_per_second"
+    ]
+    summary = profiled.groupby(point, dropna=False).agg(
+        runs=("run", "count"),
+        wall_time=("wall_time", "sum"),
+        peak_queue_size=("peak_queue_size", "max"),
+        **{column: (column, "sum") for column in timings},
+    )
+    summary["time_per_run"] = summary["wall_time"] / summary["runs"]
+    summary["events_per_second"] = summary["events_processed"] / summary["wall_time"]
+    return summary.sort_values("wall_time", ascending=False).reset_index()
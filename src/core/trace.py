@@ -0,0 +1,106 @@
+""" Event traces: recording and replaying the events delivered in a run """
+
+import json
+
+import numpy as np
+from core.attacker import Attacker, AttackerEnsemble
+from utils.basic_types import Event, NodeID
+
+# One fixed-width record per delivered event
+TRACE_DTYPE = np.dtype([("source", "<i8"), ("target", "<i8"), ("timestamp", "<f8")])
+
+
+class EventTrace:
+    """Events delivered (i.e. processed, not dropped) in a run, in processing order,
+    together with the message's source.
+    A trace is saved as <path>.npy (a structured array that loads memory-mapped)
+    and <path>.json (metadata)."""
+
+    def __init__(self, source: NodeID, events: np.ndarray):
+        self.source = source
+        self.events = events
+
+    @classmethod
+    def from_lists(
+        cls,
+        source: NodeID,
+        sources: list[NodeID],
+        targets: list[NodeID],
+        timestamps: list[float],
+    ) -> "EventTrace":
+        """Creates a trace from the event columns"""
+        events = np.empty(len(sources), dtype=TRACE_DTYPE)
+        events["source"] = sources
+        events["target"] = targets
+        events["timestamp"] = timestamps
+        return cls(source, events)
+
+    @property
+    def sources(self) -> np.ndarray:
+        """Sender of each event"""
+        return self.events["source"]
+
+    @property
+    def targets(self) -> np.ndarray:
+        """Receiver of each event"""
+        return self.events["target"]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """Delivery time of each event"""
+        return self.events["timestamp"]
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def save(self, path: str) -> None:
+        """Writes the trace to <path>.npy and <path>.json"""
+        np.save(path + ".npy", self.events)
+        with open(path + ".json", "w") as file:
+            json.dump({"source": int(self.source), "num_events": len(self)}, file)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "EventTrace":
+        """Reads a trace written by [save], memory-mapped by default"""
+        with open(path + ".json", "r") as file:
+            meta = json.load(file)
+        events = np.load(path + ".npy", mmap_mode="r" if mmap else None)
+        return cls(meta["source"], events)
+
+    def group_by_curious_node(
+        self, curious_node_ids: set[NodeID]
+    ) -> dict[NodeID, list[Event]]:
+        """Returns the events observed by each curious node (received by it, or sent
+        by it to an honest node), in processing order"""
+        curious = np.array(list(curious_node_ids), dtype=np.int64)
+        curious_targets = np.isin(self.targets, curious)
+        curious_sources = np.isin(self.sources, curious)
+        observed = np.flatnonzero(curious_targets | curious_sources)
+        observers = np.where(
+            curious_targets[observed], self.targets[observed], self.sources[observed]
+        )
+
+        grouped: dict[NodeID, list[Event]] = {}
+        for i, observer in zip(observed.tolist(), observers.tolist()):
+            record = self.events[i]
+            grouped.setdefault(observer, []).append(
+                Event(
+                    source=int(record["source"]),
+                    target=int(record["target"]),
+                    timestamp=float(record["timestamp"]),
+                    id=i,
+                )
+            )
+        return grouped
+
+    def replay(self, attacker: Attacker | AttackerEnsemble) -> None:
+        """Feeds the trace to an attacker (through process_all_events) or to an
+        ensemble (through process_event_log)"""
+        if isinstance(attacker, AttackerEnsemble):
+            attacker.process_event_log(
+                self.sources.tolist(), self.targets.tolist(), self.timestamps
+            )
+        else:
+            attacker.process_all_events(
+                self.group_by_curious_node(attacker.curious_node_ids)
+            )
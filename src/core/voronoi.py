@@ -4,18 +4,11 @@ import numpy as np
 from scipy.spatial import Voronoi
 
 
-def create_voronoi(cluster_map):
-
-    # Calculate clusters centroids
-    centroids = list()
-    for cluster_nodes in cluster_map.values():
-        positions = np.array(
-            [[x, y] for x, y in [(node.pos.x, node.pos.y) for node in cluster_nodes]]
-        )
-        centroids.append(np.mean(positions, axis=0))
-
-    # Voronoi tessellation
-    centroids = np.array(centroids)[:, [1, 0]]
+def voronoi_neighbors(centroids: np.ndarray) -> tuple[Voronoi, dict[int, set[int]]]:
+    """Tessellates the given (latitude, longitude) centroids, wrapping at
+    longitude ±180, and returns the tessellation and the neighbours of each
+    centroid (by row index)."""
+    centroids = np.asarray(centroids)[:, [1, 0]]
     # Extend centroids for wrapping at x = ±180
     extended_centroids = np.vstack(
         [
@@ -42,9 +35,26 @@ def create_voronoi(cluster_map):
         if not inside:
             continue
 
-        cluster_a = point_pair[0] % len(centroids)
-        cluster_b = point_pair[1] % len(centroids)
-        neighbors[cluster_a].add(int(cluster_b))
-        neighbors[cluster_b].add(int(cluster_a))
+        cluster_a = int(point_pair[0] % len(centroids))
+        cluster_b = int(point_pair[1] % len(centroids))
+        neighbors[cluster_a].add(cluster_b)
+        neighbors[cluster_b].add(cluster_a)
 
     return vor, neighbors
+
+
+def create_voronoi(cluster_map):
+    """Tessellates the centroids of the given clusters; neighbours are keyed by
+    cluster id"""
+    cluster_ids = list(cluster_map)
+    centroids = np.array(
+        [
+            np.mean([[node.pos.x, node.pos.y] for node in cluster_nodes], axis=0)
+            for cluster_nodes in cluster_map.values()
+        ]
+    )
+    vor, neighbors = voronoi_neighbors(centroids)
+    return vor, {
+        cluster_ids[index]: {cluster_ids[other] for other in others}
+        for index, others in neighbors.items()
+    }
@@ -0,0 +1,266 @@
+""" Multi-message workloads """
+
+from array import array
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+import heapq
+
+import numpy as np
+from core.attacker import Attacker, AttackerEnsemble
+from core.simulator import RunStats, Simulator
+from utils.basic_types import Event, NodeID
+from utils.metrics import Metric, Metrics
+
+
+def poisson_arrivals(
+    rate: float, num_messages: int, rng: np.random.Generator, start: float = 0
+) -> np.ndarray:
+    """Publish times of [num_messages] messages arriving as a Poisson process of
+    [rate] messages per time unit"""
+    return start + np.cumsum(rng.exponential(1 / rate, size=num_messages))
+
+
+def sample_sources(
+    num_nodes: int,
+    num_messages: int,
+    rng: np.random.Generator,
+    weights: np.ndarray | None = None,
+) -> np.ndarray:
+    """Node indices of the messages' publishers, uniform or proportional to
+    [weights] (index-aligned with network.nodes)"""
+    if weights is None:
+        return rng.integers(0, num_nodes, size=num_messages)
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.shape != (num_nodes,) or (weights < 0).any() or weights.sum() <= 0:
+        raise ValueError(
+            f"Source weights must be {num_nodes} non-negative values with a positive sum"
+        )
+    return rng.choice(num_nodes, size=num_messages, p=weights / weights.sum())
+
+
+@dataclass(slots=True)
+class MessageState:
+    """Counters of an in-flight message. Receipt counts and arrival times (relative
+    to the publish time) are compact arrays aligned with the network's node index."""
+
+    message: int
+    source: NodeID
+    publish_time: float
+    receipt_counts: array
+    arrival_times: array
+    attackers: list[Attacker] = field(default_factory=list)
+    ensembles: list[AttackerEnsemble] = field(default_factory=list)
+    log_sources: list[NodeID] = field(default_factory=list)
+    log_targets: list[NodeID] = field(default_factory=list)
+    log_timestamps: list[float] = field(default_factory=list)
+    stats: RunStats = field(default_factory=RunStats)
+    num_informed: int = 1
+    num_saturated: int = 0
+    pending: int = 0  # Events of this message still in the queue
+
+
+@dataclass
+class MessageResult:
+    """Outcome of one message of a workload"""
+
+    message: int
+    source: NodeID
+    publish_time: float
+    completion_time: float
+    stretch: Metric
+    attacker_results: Metric
+    metrics: Metrics
+    stats: RunStats
+
+
+def run_workload(
+    simulator: Simulator,
+    num_messages: int,
+    rate: float,
+    source_weights: np.ndarray | None = None,
+    seed: int | None = None,
+    attackers_factory: (
+        Callable[[NodeID], list[Attacker | AttackerEnsemble]] | None
+    ) = None,
+    msg_receival_limit: int = 10,
+    stop_when_all_informed: bool = True,
+) -> Iterator[MessageResult]:
+    """Spreads [num_messages] messages, published as a Poisson process of [rate]
+    messages per time unit, through one shared event loop.
+
+    Every message follows the rules of Simulator.run independently of the others
+    (its own receipt limit, stop conditions and attackers, built per message by
+    attackers_factory(source)), but all of them share one event queue and
+    one random stream. Sources are uniform, or proportional to [source_weights]
+    (index-aligned with network.nodes). A message's result is yielded as soon as
+    it completes, so results come out in completion order; the totals over the
+    whole workload are kept in simulator.last_run_stats.
+    """
+    if seed is not None:
+        simulator.seed(seed)
+    rng = np.random.default_rng(seed)
+    network = simulator.network
+    nodes = network.nodes
+    node_index = network.node_index
+    num_nodes = len(nodes)
+    select_targets = simulator.gossip_algorithm.select_targets
+    get_delays = network.get_delays
+
+    publish_times = poisson_arrivals(rate, num_messages, rng)
+    source_indices = sample_sources(num_nodes, num_messages, rng, source_weights)
+
+    # Queue entries are (timestamp, seq, message, source, target); a publish is an
+    # entry without a source
+    queue = [
+        (publish_time, message, message, None, nodes[source_index].node_id)
+        for message, (publish_time, source_index) in enumerate(
+            zip(publish_times.tolist(), source_indices.tolist())
+        )
+    ]
+    seq = num_messages
+    active: dict[int, MessageState] = {}
+    stale = 0  # Queued events of completed messages
+    totals = RunStats(peak_queue_size=len(queue))
+
+    def push(state: MessageState, event_time: float, source: NodeID, targets: list):
+        nonlocal seq
+        counts = state.receipt_counts
+        open_targets = [
+            target
+            for target in targets
+            if counts[node_index[target]] <= msg_receival_limit
+        ]
+        state.stats.events_pruned += len(targets) - len(open_targets)
+        if not open_targets:
+            return
+        delays = get_delays(source, open_targets)
+        for timestamp, target in zip((event_time + delays).tolist(), open_targets):
+            heapq.heappush(queue, (timestamp, seq, state.message, source, target))
+            seq += 1
+        state.pending += len(open_targets)
+        state.stats.events_pushed += len(open_targets)
+        if len(queue) > totals.peak_queue_size:
+            totals.peak_queue_size = len(queue)
+
+    def finish(state: MessageState, completion_time: float) -> MessageResult:
+        nonlocal queue, stale
+        del active[state.message]
+        stats = state.stats
+        if state.num_saturated == num_nodes:
+            stats.events_dropped += state.pending
+
+        # Events of completed messages are skipped when popped, and removed in bulk
+        # once they make up half of the queue (publishes of later messages are kept)
+        stale += state.pending
+        if stale > len(queue) // 2:
+            queue = [entry for entry in queue if entry[3] is None or entry[2] in active]
+            heapq.heapify(queue)
+            stale = 0
+
+        stats.peak_queue_size = totals.peak_queue_size
+        totals.events_pushed += stats.events_pushed
+        totals.events_processed += stats.events_processed
+        totals.events_pruned += stats.events_pruned
+        totals.events_dropped += stats.events_dropped
+
+        attacker_results = []
+        for attacker in state.attackers:
+            attacker_results.append(attacker.guess() == state.source)
+        for ensemble in state.ensembles:
+            ensemble.process_event_log(
+                state.log_sources, state.log_targets, state.log_timestamps
+            )
+            attacker_results += [guess == state.source for guess in ensemble.guess()]
+
+        metrics = Metrics(
+            network,
+            nodes[node_index[state.source]],
+            np.frombuffer(state.arrival_times, dtype=np.float64),
+            receipt_counts=np.frombuffer(state.receipt_counts, dtype=np.int32),
+            messages_sent=stats.events_pushed + stats.events_pruned,
+        )
+        return MessageResult(
+            message=state.message,
+            source=state.source,
+            publish_time=state.publish_time,
+            completion_time=completion_time,
+            stretch=metrics.get_stretch(),
+            attacker_results=Metric(attacker_results),
+            metrics=metrics,
+            stats=stats,
+        )
+
+    while queue:
+        event_time, event_id, message, source, target = heapq.heappop(queue)
+
+        if source is None:
+            # Publish: the message starts at its source
+            state = MessageState(
+                message,
+                target,
+                event_time,
+                array("i", bytes(4 * num_nodes)),
+                array("d", [float("nan")]) * num_nodes,
+            )
+            active[message] = state
+            for attacker in attackers_factory(target) if attackers_factory else []:
+                if isinstance(attacker, AttackerEnsemble):
+                    state.ensembles.append(attacker)
+                else:
+                    state.attackers.append(attacker)
+            source_index = node_index[target]
+            state.receipt_counts[source_index] = 1
+            state.arrival_times[source_index] = 0
+            state.num_saturated = 1 if msg_receival_limit < 1 else 0
+            push(state, event_time, target, select_targets(target))
+        else:
+            state = active.get(message)
+            if state is None:
+                # The message already completed
+                stale -= 1
+                continue
+            state.pending -= 1
+
+            # Check if node is still processing events
+            target_index = node_index[target]
+            counts = state.receipt_counts
+            receipts = counts[target_index]
+            if receipts > msg_receival_limit:
+                state.stats.events_dropped += 1
+            else:
+                counts[target_index] = receipts + 1
+                if receipts == msg_receival_limit:
+                    state.num_saturated += 1
+                state.stats.events_processed += 1
+
+                # Send event to attackers, with times relative to the publish
+                relative_time = event_time - state.publish_time
+                if state.attackers:
+                    event = Event(
+                        source=source,
+                        target=target,
+                        timestamp=relative_time,
+                        id=event_id,
+                    )
+                    for attacker in state.attackers:
+                        if attacker.has_access_to_event(event):
+                            attacker.process_event(event)
+                if state.ensembles:
+                    state.log_sources.append(source)
+                    state.log_targets.append(target)
+                    state.log_timestamps.append(relative_time)
+
+                if receipts == 0:
+                    state.arrival_times[target_index] = relative_time
+                    state.num_informed += 1
+
+                push(state, event_time, target, select_targets(target))
+
+        if (
+            state.pending == 0
+            or (stop_when_all_informed and state.num_informed == num_nodes)
+            or state.num_saturated == num_nodes
+        ):
+            yield finish(state, event_time)
+
+    simulator.last_run_stats = totals
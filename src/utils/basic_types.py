@@ -3,12 +3,11 @@
 from dataclasses import dataclass
 from utils.position import CoordinateSystemPoint
 
+# Node ids are plain ints (an int subclass would make every id a separate heap object)
+NodeID = int
 
-class NodeID(int):
-    """NodeID"""
 
-
-@dataclass
+@dataclass(slots=True)
 class Node:
     """Node"""
 
@@ -16,7 +15,7 @@ class Node:
     pos: CoordinateSystemPoint
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Ping:
     """Ping"""
 
@@ -24,7 +23,7 @@ class Ping:
     std_dev: float
 
 
-@dataclass
+@dataclass(slots=True)
 class Event:
     """Network event"""
 
@@ -0,0 +1,50 @@
+""" Cache """
+
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+
+class LRUCache:
+    """In-memory least-recently-used cache, bounded by its number of entries and,
+    optionally, by the total nbytes of its (array) values"""
+
+    def __init__(self, maxsize: int = 8, max_bytes: int | None = None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self.nbytes = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the cached value (marking it as recently used) or [default]"""
+        if key not in self.entries:
+            return default
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Stores a value, evicting the least recently used entries if full. Values
+        larger than [max_bytes] are not stored."""
+        size = getattr(value, "nbytes", 0)
+        if key in self.entries:
+            self.nbytes -= getattr(self.entries.pop(key), "nbytes", 0)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self.entries[key] = value
+        self.nbytes += size
+        while len(self.entries) > self.maxsize or (
+            self.max_bytes is not None and self.nbytes > self.max_bytes
+        ):
+            _, evicted = self.entries.popitem(last=False)
+            self.nbytes -= getattr(evicted, "nbytes", 0)
+
+    def clear(self) -> None:
+        """Removes every entry"""
+        self.entries.clear()
+        self.nbytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -68,23 +68,357 @@ class Metric:
         plt.show()
 
 
+class TDigest:
+    """Merging t-digest quantile sketch (Dunning): a bounded list of weighted
+    centroids, small near the tails (k2 scale function), that can be merged with
+    other digests. The exact min and max are tracked to anchor the tails."""
+
+    def __init__(self, compression: float = 100):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.buffer: list[np.ndarray] = []
+        self.buffered = 0
+        self.min_value = float("inf")
+        self.max_value = float("-inf")
+
+    def update(self, values: np.ndarray) -> None:
+        """Adds values"""
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        self.min_value = min(self.min_value, float(values.min()))
+        self.max_value = max(self.max_value, float(values.max()))
+        self.buffer.append(values)
+        self.buffered += len(values)
+        if self.buffered > 10 * self.compression:
+            self.compress()
+
+    def merge(self, other: "TDigest") -> None:
+        """Adds every value summarized by another digest"""
+        other.compress()
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        self.means = np.concatenate([self.means, other.means])
+        self.weights = np.concatenate([self.weights, other.weights])
+        self.compress()
+
+    def compress(self) -> None:
+        """Merges buffered values and neighbouring centroids within the size limit"""
+        means = np.concatenate([self.means, *self.buffer])
+        weights = np.concatenate(
+            [self.weights, *[np.ones(len(values)) for values in self.buffer]]
+        )
+        self.buffer = []
+        self.buffered = 0
+        if len(means) == 0:
+            return
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+
+        # k2 scale function: a centroid may span at most 1 unit of k(q), which grows
+        # like log(q / (1 - q)), so centroids near the tails are small
+        normalizer = self.compression / (4 * np.log(total / self.compression) + 24)
+
+        def scale(q: float) -> float:
+            q = min(max(q, 1e-15), 1 - 1e-15)
+            return normalizer * np.log(q / (1 - q))
+
+        new_means: list[float] = []
+        new_weights: list[float] = []
+        cumulative = 0.0
+        current_mean, current_weight = means[0], weights[0]
+        limit = scale(0) + 1
+        for mean, weight in zip(means[1:].tolist(), weights[1:].tolist()):
+            if scale((cumulative + current_weight + weight) / total) <= limit:
+                current_weight += weight
+                current_mean += (mean - current_mean) * weight / current_weight
+            else:
+                new_means.append(current_mean)
+                new_weights.append(current_weight)
+                cumulative += current_weight
+                limit = scale(cumulative / total) + 1
+                current_mean, current_weight = mean, weight
+        new_means.append(current_mean)
+        new_weights.append(current_weight)
+        self.means = np.array(new_means)
+        self.weights = np.array(new_weights)
+
+    def quantile(self, q: float) -> float:
+        """Estimates the [q] quantile, interpolating between the centroid centers
+        (the middle of their cumulative weight). Beyond the outer centers, it
+        interpolates towards the exact min and max, and centroids of weight 1 are
+        exact values."""
+        self.compress()
+        if len(self.means) == 0:
+            return float("nan")
+        means = self.means.tolist()
+        weights = self.weights.tolist()
+        total = float(self.weights.sum())
+        index = q * total
+
+        # Tails: the min and max are single values, and the outer half of the
+        # first and last centroids are spread between them and their means
+        if index < 1:
+            return self.min_value
+        if weights[0] > 1 and index < weights[0] / 2:
+            return self.min_value + (index - 1) / (weights[0] / 2 - 1) * (
+                means[0] - self.min_value
+            )
+        if index > total - 1:
+            return self.max_value
+        if weights[-1] > 1 and total - index <= weights[-1] / 2:
+            return self.max_value - (total - index - 1) / (weights[-1] / 2 - 1) * (
+                self.max_value - means[-1]
+            )
+
+        center = weights[0] / 2
+        for i in range(len(means) - 1):
+            step = (weights[i] + weights[i + 1]) / 2
+            if center + step > index:
+                left_unit = right_unit = 0.0
+                if weights[i] == 1:
+                    if index - center < 0.5:
+                        return means[i]
+                    left_unit = 0.5
+                if weights[i + 1] == 1:
+                    if center + step - index <= 0.5:
+                        return means[i + 1]
+                    right_unit = 0.5
+                left = index - center - left_unit
+                right = center + step - index - right_unit
+                return (means[i] * right + means[i + 1] * left) / (left + right)
+            center += step
+        return means[-1]
+
+
+class StreamingMetric:
+    """Constant-memory alternative to Metric, for aggregating many runs.
+
+    Keeps the count, running mean and variance (Welford/Chan), min/max, a histogram
+    over fixed bins and a t-digest for quantiles. While at most [exact_limit] values
+    were seen, they are kept and quantiles are exact. Non-finite values are only
+    counted (num_non_finite). Instances can be merged, e.g. across processes.
+    """
+
+    def __init__(
+        self,
+        bins: int = 50,
+        value_range: tuple[float, float] = (0, 10),
+        exact_limit: int = 10_000,
+        compression: float = 100,
+    ):
+        self.count = 0
+        self.mean_value = 0.0
+        self.m2 = 0.0
+        self.min_value = float("inf")
+        self.max_value = float("-inf")
+        self.num_non_finite = 0
+        self.bin_edges = np.linspace(value_range[0], value_range[1], bins + 1)
+        # Counts per bin, plus the values below and above the range
+        self.bin_counts = np.zeros(bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+        self.exact_limit = exact_limit
+        self.exact_values: list[np.ndarray] | None = []
+        self.digest = TDigest(compression)
+
+    def update(self, values) -> None:
+        """Adds values (a list, array or Metric)"""
+        if isinstance(values, Metric):
+            values = values.values
+        values = np.asarray(values, dtype=np.float64).ravel()
+        finite = np.isfinite(values)
+        self.num_non_finite += int((~finite).sum())
+        values = values[finite]
+        if len(values) == 0:
+            return
+
+        self.combine_moments(
+            len(values), values.mean(), ((values - values.mean()) ** 2).sum()
+        )
+        self.min_value = min(self.min_value, float(values.min()))
+        self.max_value = max(self.max_value, float(values.max()))
+        counts, _ = np.histogram(values, bins=self.bin_edges)
+        self.bin_counts += counts
+        self.underflow += int((values < self.bin_edges[0]).sum())
+        self.overflow += int((values > self.bin_edges[-1]).sum())
+
+        if self.exact_values is not None:
+            self.exact_values.append(values)
+            if self.count > self.exact_limit:
+                self.spill_exact_values()
+        else:
+            self.digest.update(values)
+
+    def combine_moments(self, count: int, mean: float, m2: float) -> None:
+        """Combines the running moments with those of another group of values"""
+        total = self.count + count
+        delta = mean - self.mean_value
+        self.mean_value += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def spill_exact_values(self) -> None:
+        """Moves the kept values into the digest"""
+        for values in self.exact_values:
+            self.digest.update(values)
+        self.exact_values = None
+
+    def merge(self, other: "StreamingMetric") -> None:
+        """Adds every value summarized by [other] (which must use the same bins)"""
+        if not np.array_equal(self.bin_edges, other.bin_edges):
+            raise ValueError("Cannot merge metrics with different histogram bins")
+        if other.count:
+            self.combine_moments(other.count, other.mean_value, other.m2)
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        self.num_non_finite += other.num_non_finite
+        self.bin_counts += other.bin_counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+
+        if self.exact_values is not None and other.exact_values is not None:
+            self.exact_values += other.exact_values
+            if self.count > self.exact_limit:
+                self.spill_exact_values()
+            return
+        if self.exact_values is not None:
+            self.spill_exact_values()
+        if other.exact_values is not None:
+            for values in other.exact_values:
+                self.digest.update(values)
+        else:
+            self.digest.merge(other.digest)
+
+    def is_exact(self) -> bool:
+        """Returns whether quantiles are computed from the raw values"""
+        return self.exact_values is not None
+
+    def mean(self):
+        """Returns the mean"""
+        return self.mean_value if self.count else float("nan")
+
+    def variance(self):
+        """Returns the (population) variance"""
+        return self.m2 / self.count if self.count else float("nan")
+
+    def std(self):
+        """Returns the (population) standard deviation"""
+        return np.sqrt(self.variance())
+
+    def quantile(self, q: float):
+        """Returns the [q] quantile, exact while the values are kept"""
+        if self.exact_values is not None:
+            if not self.exact_values:
+                return float("nan")
+            return float(np.quantile(np.concatenate(self.exact_values), q))
+        return self.digest.quantile(q)
+
+    def median(self):
+        """Returns the median"""
+        return self.quantile(0.5)
+
+    def max(self):
+        """Returns the max"""
+        return self.max_value
+
+    def min(self):
+        """Returns the min"""
+        return self.min_value
+
+    def __repr__(self):
+        return f"Mean: {self.mean()} | Median: {self.median()} | Max: {self.max()} | Min: {self.min()}"
+
+    def plot_histogram(
+        self,
+        xlabel: str,
+        save: bool,
+        fname: str = "histogram.png",
+        color: str = "blue",
+    ):
+        """Plots the fixed-bin histogram (values outside the bins are left out)"""
+        percentages = 100 * self.bin_counts / max(self.count, 1)
+
+        plt.figure(figsize=(8, 6))
+        plt.bar(
+            self.bin_edges[:-1],
+            percentages,
+            width=np.diff(self.bin_edges),
+            color=color,
+            edgecolor="black",
+            align="edge",
+        )
+
+        plt.xlabel(xlabel, fontsize=12)
+        plt.ylabel("Frequency (%)", fontsize=12)
+        plt.grid(axis="y", linestyle="--", alpha=0.7)
+        plt.xticks(fontsize=10)
+        plt.yticks(fontsize=10)
+
+        plt.tight_layout()
+        if save:
+            plt.savefig(fname, dpi=300)
+        plt.show()
+
+
 class Metrics:
-    """Metrics"""
+    """Metrics of a run. Arrival times (and receipt counts) are arrays aligned with
+    the network's node index, with NaN for nodes that were never reached; a dict
+    NodeID -> arrival time is also accepted."""
 
     def __init__(
-        self, network: Network, source: Node, arrival_times: dict[NodeID, float]
+        self,
+        network: Network,
+        source: Node,
+        arrival_times: np.ndarray | dict[NodeID, float],
+        receipt_counts: np.ndarray | None = None,
+        messages_sent: int | None = None,
     ):
         self.source = source
-        self.arrival_times = arrival_times
         self.network = network
+        if isinstance(arrival_times, dict):
+            times = np.full(len(network.nodes), np.nan)
+            for node, time in arrival_times.items():
+                times[network.node_index[node]] = time
+            arrival_times = times
+        self.arrival_times: np.ndarray = arrival_times
+        self.receipt_counts = receipt_counts
+        self.messages_sent = messages_sent
 
     def get_stretch(self) -> Metric:
         """Computes the stretch"""
-        stretches: list[float] = []
-        for node, time in self.arrival_times.items():
-            if node == self.source.node_id:
-                continue
-            stretches.append(
-                time / self.network.get_base_delay(self.source.node_id, node)
-            )
-        return Metric(stretches)
+        reached = ~np.isnan(self.arrival_times)
+        reached[self.network.node_index[self.source.node_id]] = False
+        base_delays = self.network.get_base_delays(self.source.node_id)
+        return Metric((self.arrival_times[reached] / base_delays[reached]).tolist())
+
+    def get_num_informed(self) -> int:
+        """Returns the number of nodes that received the message (source included)"""
+        return int((~np.isnan(self.arrival_times)).sum())
+
+    def get_coverage_time(self, fraction: float) -> float:
+        """Returns the time at which [fraction] of the nodes (source included) had
+        received the message, or NaN if that coverage was never reached"""
+        needed = max(1, int(np.ceil(fraction * len(self.arrival_times))))
+        times = np.sort(self.arrival_times[~np.isnan(self.arrival_times)])
+        if needed > len(times):
+            return float("nan")
+        return float(times[needed - 1])
+
+    def get_receipt_counts(self) -> np.ndarray:
+        """Returns the number of messages processed by each node"""
+        return self.receipt_counts
+
+    def get_messages_sent(self) -> int:
+        """Returns the number of messages sent, including those to saturated nodes
+        that were never simulated"""
+        return self.messages_sent
+
+    def get_duplicate_ratio(self) -> float:
+        """Returns the fraction of sent messages that did not inform a new node"""
+        if not self.messages_sent:
+            return float("nan")
+        useful = self.get_num_informed() - 1
+        return (self.messages_sent - useful) / self.messages_sent
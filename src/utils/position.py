@@ -8,6 +8,8 @@ import random
 class CoordinateSystemPoint(ABC):
     """Abstract coordinate system point"""
 
+    __slots__ = ()
+
     @abstractmethod
     def __add__(self, other):
         """Outputs the addition of itself with another point"""
@@ -44,6 +46,8 @@ class CoordinateSystemPoint(ABC):
 class Euclidean2D(CoordinateSystemPoint):
     """Implements the Euclidean 2D coordinate system"""
 
+    __slots__ = ("x", "y")
+
     def __init__(self, x: float, y: float):
         self.x = x
         self.y = y
@@ -1,8 +1,9 @@
 """ Probability """
 
-import copy
 import random
 
+import numpy as np
+
 
 def bernoulli_event(probability: float) -> bool:
     """Sample an event"""
@@ -22,10 +23,9 @@ def select_samples_from_group_with_replacement(population: list, k: int = 1) ->
 
 
 def select_samples_from_group_without_replacement(population: list, k: int = 1) -> list:
-    """Select samples from a population without replacement"""
-    copied_population = copy.copy(population)
-    random.shuffle(copied_population)
-    return copied_population[:k]
+    """Select samples from a population without replacement.
+    Only O(k) work is done (random.sample), instead of shuffling the population."""
+    return random.sample(population, min(k, len(population)))
 
 
 def hypergeometric_sample(a: int, b: int, k: int) -> int:
@@ -35,3 +35,47 @@ def hypergeometric_sample(a: int, b: int, k: int) -> int:
     selection_event = space[:k]
     sum_of_events_a = sum(selection_event)
     return sum_of_events_a
+
+
+class HalfNormalSampler:
+    """Hands out standard half-normal samples (|N(0, 1)|) drawn in blocks from a
+    numpy Generator, so the per-sample cost is an index increment"""
+
+    def __init__(self, seed: int | None = None, block_size: int = 1 << 16):
+        self.block_size = block_size
+        self.seed(seed)
+
+    def seed(self, seed: int | None) -> None:
+        """Resets the generator and discards the buffered samples. The next block is
+        only drawn when a sample is requested, so reseeding is cheap."""
+        self.rng = np.random.default_rng(seed)
+        self.block: np.ndarray | None = None
+        self.values: list[float] = []
+        self.position = self.block_size
+
+    def refill(self) -> None:
+        """Draws a new block of samples"""
+        self.block = np.abs(self.rng.standard_normal(self.block_size))
+        self.values = self.block.tolist()
+        self.position = 0
+
+    def next(self) -> float:
+        """Returns one sample"""
+        if self.position == self.block_size:
+            self.refill()
+        value = self.values[self.position]
+        self.position += 1
+        return value
+
+    def take(self, k: int) -> np.ndarray:
+        """Returns an array of [k] samples"""
+        if self.block is None:
+            # Same stream as if the first block had been drawn on seed()
+            self.refill()
+        if self.position + k > self.block_size:
+            if k > self.block_size:
+                return np.abs(self.rng.standard_normal(k))
+            self.refill()
+        samples = self.block[self.position : self.position + k]
+        self.position += k
+        return samples
@@ -0,0 +1,61 @@
+""" Tests of the attackers' probability estimates """
+
+import random
+
+import pytest
+
+from core import attacker as attacker_module
+from core.attacker import LowestTimeEstimator, UniformEstimator, create_random_attackers
+from core.gossip_algorithm import GossipSub
+from core.network import Network
+from core.simulator import Simulator
+from utils.basic_types import Event
+
+
+def test_probability_writes_go_through_to_weights():
+    attacker = UniformEstimator([1, 2, 3, 4], [4])
+    attacker.process_event(Event(source=1, target=4, timestamp=0.5, id=0))
+    attacker.probability = {1: 0.2, 2: 0.7, 3: 0.1}
+    assert attacker.guess() == 2
+    assert attacker.probability == pytest.approx({1: 0.2, 2: 0.7, 3: 0.1})
+
+    # Later events update the written probabilities
+    attacker.process_event(Event(source=3, target=4, timestamp=0.1, id=1))
+    assert sum(attacker.probability.values()) == pytest.approx(1)
+    assert attacker.probability[3] > 0.1
+
+
+def test_probability_item_writes_fail():
+    attacker = UniformEstimator([1, 2, 3], [3])
+    with pytest.raises(TypeError):
+        attacker.probability[1] = 1.0
+    with pytest.raises(ValueError):
+        attacker.probability = {3: 1.0}
+
+
+def test_lowest_time_probability_cannot_be_set():
+    attacker = LowestTimeEstimator([1, 2, 3], [3])
+    with pytest.raises(TypeError):
+        attacker.probability = {1: 1.0}
+
+
+@pytest.mark.parametrize("chunk", [attacker_module.EVENT_CHUNK, 7])
+def test_ensemble_matches_individual_attackers(monkeypatch, chunk):
+    monkeypatch.setattr(attacker_module, "EVENT_CHUNK", chunk)
+    network = Network.randomize(100, 1000, seed=1)
+    node_ids = list(network.node_index)
+    simulator = Simulator(network, GossipSub(network, 6))
+    simulator.seed(0)
+    simulator.setup()
+    source = simulator.first_source.node_id
+
+    random.seed(1)
+    individual = create_random_attackers(UniformEstimator, node_ids, source, 0.1, 20)
+    random.seed(1)
+    [ensemble] = create_random_attackers(
+        UniformEstimator, node_ids, source, 0.1, 20, as_ensemble=True
+    )
+    simulator.seed(0)
+    simulator.setup()
+    simulator.run(attackers=individual + [ensemble], msg_receival_limit=3)
+    assert ensemble.guess() == [attacker.guess() for attacker in individual]
@@ -0,0 +1,58 @@
+""" Statistical equivalence of BatchSimulator with Simulator.run (a small version
+of benchmarks/batch_equivalence.py)"""
+
+import numpy as np
+import pytest
+from scipy.stats import ks_2samp
+
+from core.batch_simulator import BatchSimulator
+from core.gossip_algorithm import CobraWalk, GossipSub, RandomWalk
+from core.network import Network
+from core.simulator import Simulator
+
+RUNS = 150
+LIMIT = 3
+ALPHA = 0.01
+
+
+@pytest.fixture(scope="module")
+def network() -> Network:
+    return Network.randomize(60, grid_size=1000, seed=0)
+
+
+def summarize(stretches) -> np.ndarray:
+    """Per-run (mean stretch over finite values, reached nodes)"""
+    rows = []
+    for stretch in stretches:
+        values = np.array(stretch.values, dtype=np.float64)
+        finite = values[np.isfinite(values)]
+        rows.append((finite.mean() if len(finite) else np.nan, len(values)))
+    return np.array(rows)
+
+
+@pytest.mark.parametrize(
+    "create",
+    [
+        lambda network: GossipSub(network, 6),
+        lambda network: CobraWalk(network, 0.6),
+        RandomWalk,
+    ],
+    ids=["GossipSub", "CobraWalk", "RandomWalk"],
+)
+def test_batch_matches_simulator(network: Network, create):
+    algorithm = create(network)
+    simulator = Simulator(network, algorithm)
+    simulator.seed(0)
+    reference = []
+    for _ in range(RUNS):
+        simulator.setup()
+        stretch, _ = simulator.run(msg_receival_limit=LIMIT)
+        reference.append(stretch)
+    batch = BatchSimulator(network, algorithm).run(
+        n_runs=RUNS, seed=0, msg_receival_limit=LIMIT
+    )
+
+    reference, batch = summarize(reference), summarize(batch)
+    for column in range(2):
+        a, b = reference[:, column], batch[:, column]
+        assert ks_2samp(a[np.isfinite(a)], b[np.isfinite(b)]).pvalue >= ALPHA
@@ -0,0 +1,39 @@
+""" Tests of network clustering """
+
+import numpy as np
+
+from core import clustering
+from core.clustering import cluster_network
+from core.gossip_algorithm import (
+    HierarchialGossip,
+    HierarchicalIntraCobraWalkInterBernoulliWithVoronoi,
+)
+from core.network import Network
+
+
+def test_single_cluster_needs_no_tessellation():
+    network = Network.randomize(20, 10, seed=0)
+    algorithm = HierarchialGossip(network, 2, 2, num_clusters=1)
+    assert not algorithm.clustering.has_neighbors
+    assert set(algorithm.select_targets(algorithm.node_ids[0])) <= set(
+        algorithm.node_ids
+    )
+
+
+def test_neighbors_are_computed_on_demand(tmp_path):
+    network = Network.randomize(200, 90, seed=0)
+    clustering._clustering_cache.clear()
+    computed = cluster_network(network, 6, cache_dir=str(tmp_path))
+    assert not computed.has_neighbors
+
+    clustering._clustering_cache.clear()
+    loaded = cluster_network(network, 6, cache_dir=str(tmp_path))
+    assert loaded is not computed
+    np.testing.assert_array_equal(loaded.labels, computed.labels)
+    assert loaded.neighbors == computed.neighbors
+
+    algorithm = HierarchicalIntraCobraWalkInterBernoulliWithVoronoi(
+        network, 0.5, 0.5, 2, 6
+    )
+    assert algorithm.clustering.has_neighbors
+    assert algorithm.select_targets(algorithm.node_ids[0])
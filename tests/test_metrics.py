@@ -0,0 +1,28 @@
+""" Tests of the streaming metrics """
+
+import numpy as np
+import pytest
+
+from utils.metrics import StreamingMetric, TDigest
+
+
+def test_merged_quantiles_are_accurate():
+    values = np.random.default_rng(0).lognormal(0, 1, 200_000)
+    total = StreamingMetric()
+    for part in np.array_split(values, 37):
+        metric = StreamingMetric()
+        metric.update(part)
+        total.merge(metric)
+    assert not total.is_exact()
+
+    assert total.quantile(0) == values.min()
+    assert total.quantile(1) == values.max()
+    for q in [0.001, 0.01, 0.5, 0.99, 0.999]:
+        assert total.quantile(q) == pytest.approx(np.quantile(values, q), rel=0.03)
+
+
+def test_unit_centroids_are_exact():
+    digest = TDigest()
+    digest.update(np.array([3.0, 1.0, 2.0]))
+    assert [digest.quantile(q) for q in (0, 0.5, 1)] == [1.0, 2.0, 3.0]
+    assert np.isnan(TDigest().quantile(0.5))
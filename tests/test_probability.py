@@ -0,0 +1,45 @@
+""" Tests of the probability helpers """
+
+import numpy as np
+
+from core.gossip_algorithm import GossipSub
+from core.network import Network
+from core.simulator import Simulator
+from utils.probability import HalfNormalSampler
+
+
+def test_seed_draws_lazily():
+    sampler = HalfNormalSampler(block_size=8)
+    sampler.seed(3)
+    assert sampler.block is None
+
+    expected = np.abs(np.random.default_rng(3).standard_normal(16))
+    values = [sampler.next() for _ in range(3)]
+    values += sampler.take(7).tolist()
+    values += [sampler.next() for _ in range(6)]
+    np.testing.assert_array_equal(values[:3], expected[:3])
+    # take() skips the rest of a block when it does not fit
+    np.testing.assert_array_equal(values[3:10], expected[8:15])
+    assert values[10] == expected[15]
+
+
+def test_reseeding_repeats_the_stream():
+    sampler = HalfNormalSampler(seed=5, block_size=8)
+    first = sampler.take(20).tolist() + [sampler.next()]
+    sampler.seed(5)
+    assert sampler.take(20).tolist() + [sampler.next()] == first
+
+
+def test_take_nothing_after_seed():
+    sampler = HalfNormalSampler(seed=1, block_size=8)
+    assert sampler.take(0).shape == (0,)
+    expected = np.abs(np.random.default_rng(1).standard_normal(8))
+    assert sampler.next() == expected[0]
+
+
+def test_run_without_targets():
+    network = Network.randomize(10, 10, seed=0)
+    simulator = Simulator(network, GossipSub(network, 0))
+    simulator.setup()
+    stretch, _ = simulator.run()
+    assert stretch.values == []
@@ -0,0 +1,35 @@
+""" Tests of SparseNetwork """
+
+import pytest
+
+from core.batch_simulator import BatchSimulator
+from core.gossip_algorithm import GossipSub, SpatialGossip
+from core.network import Network
+from core.simulator import Simulator
+from core.sparse_network import SparseNetwork
+from utils.basic_types import Ping
+
+
+@pytest.fixture(scope="module")
+def networks() -> tuple[Network, SparseNetwork]:
+    network = Network.randomize(40, 20, seed=0)
+    network.base[range(40), range(40)] = 0
+    return network, SparseNetwork.from_network(network, k=39)
+
+
+def test_pings_match_the_dense_network(networks):
+    network, sparse = networks
+    source, target = list(network.node_index)[:2]
+    assert sparse.pings[source][target] == network.pings[source][target]
+    with pytest.raises(TypeError):
+        sparse.pings[source][target] = Ping(1.0, 0.0)
+
+
+def test_dense_only_users_fail_early(networks):
+    _, sparse = networks
+    with pytest.raises(TypeError, match="BatchSimulator"):
+        BatchSimulator(sparse, GossipSub(sparse, 4))
+    with pytest.raises(TypeError, match="run_shortest_paths"):
+        Simulator(sparse, GossipSub(sparse, 4)).run_shortest_paths()
+    with pytest.raises(TypeError, match="SpatialGossip"):
+        SpatialGossip(sparse, 2, 0.5)
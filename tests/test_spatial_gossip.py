@@ -0,0 +1,59 @@
+""" Tests of the spatial gossip caches and sampling """
+
+import numpy as np
+import pytest
+
+from core import gossip_algorithm
+from core.gossip_algorithm import SpatialGossip, clear_spatial_caches
+from core.network import Network
+from utils.cache import LRUCache
+
+
+def test_cache_is_bounded_by_bytes():
+    cache = LRUCache(maxsize=8, max_bytes=2000)
+    for key in range(3):
+        cache.put(key, np.zeros(100))  # 800 bytes each
+    assert list(cache.entries) == [1, 2]
+    assert cache.nbytes == 1600
+    cache.put("large", np.zeros(1000))
+    assert "large" not in cache and cache.nbytes == 1600
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+def test_uncached_spatial_gossip_leaves_caches_empty():
+    network = Network.randomize(30, 10, seed=0)
+    clear_spatial_caches()
+    uncached = SpatialGossip(network, 2, 0.5, cache=False)
+    assert len(gossip_algorithm._spatial_cdf_cache) == 0
+    assert len(gossip_algorithm._distance_cache) == 0
+
+    cached = SpatialGossip(network, 2, 0.5)
+    assert len(gossip_algorithm._spatial_cdf_cache) == 1
+    np.testing.assert_array_equal(
+        uncached.cumulative_probabilities, cached.cumulative_probabilities
+    )
+    clear_spatial_caches()
+    assert len(gossip_algorithm._spatial_cdf_cache) == 0
+
+
+def test_spatial_gossip_vectors_are_built_once():
+    network = Network.randomize(20, 10, seed=0)
+    spatial_gossip = SpatialGossip(network, 2, 0.5, cache=False)
+    with pytest.warns(DeprecationWarning):
+        vectors = spatial_gossip.spatial_gossip_vectors
+    assert spatial_gossip.spatial_gossip_vectors is vectors
+    source = spatial_gossip.node_ids[0]
+    assert source not in vectors[source]
+    assert sum(vectors[source].values()) == pytest.approx(1)
+
+
+def test_source_is_never_sampled(monkeypatch):
+    network = Network.randomize(20, 10, seed=0)
+    spatial_gossip = SpatialGossip(network, 2, 0.5, dtype=np.float32, cache=False)
+    source = spatial_gossip.node_ids[-1]
+    # The largest uniform draw, which rounds up to the row's total in float32
+    monkeypatch.setattr(np.random, "random", lambda k: np.full(k, 1 - 2**-53))
+    assert (
+        spatial_gossip.sample_targets(source, k=3) == [spatial_gossip.node_ids[-2]] * 3
+    )
@@ -0,0 +1,49 @@
+""" Tests of parameter sweeps """
+
+import pandas as pd
+import pytest
+
+from core.attacker import UniformEstimator
+from core.gossip_algorithm import GossipSub
+from core.network import Network
+from core.sweep import (
+    AttackerConfig,
+    ResultStore,
+    param_grid,
+    run_sweep,
+    summarize_profiles,
+)
+
+
+@pytest.fixture(scope="module")
+def network() -> Network:
+    return Network.randomize(30, 10, seed=0)
+
+
+def sweep(network: Network, path, workers: int, instrument: bool = False):
+    return run_sweep(
+        network,
+        GossipSub,
+        param_grid(fanout=[3, 4]),
+        ResultStore(str(path)),
+        3,
+        [[], [AttackerConfig(UniformEstimator, 0.1)]],
+        workers=workers,
+        instrument=instrument,
+    ).sort_values(["key", "run"], ignore_index=True)
+
+
+def test_results_do_not_depend_on_workers(network: Network, tmp_path):
+    serial = sweep(network, tmp_path / "serial", workers=1)
+    parallel = sweep(network, tmp_path / "parallel", workers=2)
+    assert len(serial) == 12
+    pd.testing.assert_frame_equal(serial, parallel)
+
+
+def test_summarize_profiles(network: Network, tmp_path):
+    assert summarize_profiles(sweep(network, tmp_path / "plain", workers=1)).empty
+
+    results = sweep(network, tmp_path / "instrumented", workers=2, instrument=True)
+    summary = summarize_profiles(results)
+    assert len(summary) == 4
+    assert (summary["runs"] == 3).all()
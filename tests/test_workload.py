@@ -0,0 +1,21 @@
+""" Tests of multi-message workloads """
+
+import pytest
+
+from core.gossip_algorithm import GossipSub
+from core.network import Network
+from core.simulator import Simulator
+from core.workload import run_workload
+
+
+@pytest.fixture(scope="module")
+def simulator() -> Simulator:
+    network = Network.randomize(50, 20, seed=0)
+    return Simulator(network, GossipSub(network, 4))
+
+
+@pytest.mark.parametrize("rate", [0.05, 1.0, 50.0])
+def test_every_message_completes(simulator: Simulator, rate: float):
+    results = list(run_workload(simulator, 20, rate, seed=1))
+    assert len(results) == 20
+    assert sorted(result.message for result in results) == list(range(20))